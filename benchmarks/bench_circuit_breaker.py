@@ -0,0 +1,118 @@
+"""Load shed by the circuit breaker during an upstream outage.
+
+50 clients each send a call every 25 ms for 4 s. The upstream fails
+every call after 50 ms (like a gateway timeout) for the first 2 s and
+then recovers. The same traffic is sent with and without a circuit
+breaker, and the script reports how many calls reached the upstream and
+how long callers spent waiting on failures.
+
+Run with ``python benchmarks/bench_circuit_breaker.py``.
+"""
+
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+from lion_perplexity.api_endpoints.api_request import PerplexityRequest
+from lion_perplexity.api_endpoints.circuit_breaker import CircuitBreaker
+from lion_perplexity.api_endpoints.retry import (
+    RetryBudget,
+    RetryEngine,
+    RetryPolicy,
+)
+from lion_perplexity.api_endpoints.transport import (
+    FaultInjectingTransport,
+    Transport,
+    TransportResponse,
+)
+
+CONCURRENCY = 50
+INTERVAL = 0.025  # seconds between calls of one client
+DURATION = 4.0  # seconds
+OUTAGE = 2.0  # seconds
+
+
+class OkTransport(Transport):
+    async def request(self, method, url, headers, data=None):
+        await asyncio.sleep(0.005)
+        return TransportResponse(status=200, body=b'{"ok": true}')
+
+    @asynccontextmanager
+    async def stream(self, method, url, headers, data=None):
+        await asyncio.sleep(0.005)
+
+        async def lines():
+            yield b'data: {"ok": true}\n'
+
+        yield TransportResponse(status=200, lines=lines())
+
+
+async def run(with_breaker: bool):
+    faults = FaultInjectingTransport(
+        transport=OkTransport(), failure_rate=1, failure_latency=0.05
+    )
+    request = PerplexityRequest(
+        api_key="key",
+        endpoint="chat/completions",
+        method="POST",
+        transport=faults,
+    )
+    engine = RetryEngine(
+        policy=RetryPolicy(max_retries=2, base_delay=0.01),
+        budget=RetryBudget(),
+    )
+    breaker = (
+        CircuitBreaker(minimum_calls=20, window=5, open_duration=0.25)
+        if with_breaker
+        else None
+    )
+    outcomes = {"ok": 0, "failed": 0, "wait_on_failure": 0.0}
+
+    async def heal():
+        await asyncio.sleep(OUTAGE)
+        faults.failure_rate = 0
+
+    async def worker(deadline):
+        while (start := time.perf_counter()) < deadline:
+            try:
+                await engine.run(
+                    lambda: request.invoke(json_data={"q": 1}),
+                    circuit_breaker=breaker,
+                )
+                outcomes["ok"] += 1
+            except Exception:
+                outcomes["failed"] += 1
+                outcomes["wait_on_failure"] += time.perf_counter() - start
+            await asyncio.sleep(
+                max(0.0, INTERVAL - (time.perf_counter() - start))
+            )
+
+    start = time.perf_counter()
+    healer = asyncio.create_task(heal())
+    deadline = start + DURATION
+    await asyncio.gather(*(worker(deadline) for _ in range(CONCURRENCY)))
+    healer.cancel()
+    elapsed = time.perf_counter() - start
+
+    label = "with breaker" if with_breaker else "no breaker"
+    print(
+        f"{label:<13} upstream calls {faults.calls:6d}  "
+        f"ok {outcomes['ok']:5d}  failed {outcomes['failed']:5d}  "
+        f"failure wait {outcomes['wait_on_failure']:7.1f}s  "
+        f"wall {elapsed:5.2f}s"
+    )
+    # upstream calls that hit the outage
+    return faults.calls - outcomes["ok"]
+
+
+async def main():
+    without = await run(with_breaker=False)
+    with_ = await run(with_breaker=True)
+    print(
+        f"calls into the failing upstream: {without} -> {with_} "
+        f"({1 - with_ / without:.0%} shed)"
+    )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,65 @@
+"""Rows/sec written by ``CompletionColumnarSink``.
+
+Run with ``python benchmarks/bench_columnar_sink.py``. Parquet is only
+measured when pyarrow is installed.
+"""
+
+import tempfile
+import time
+from pathlib import Path
+
+from lion_perplexity.analytics.columnar_sink import CompletionColumnarSink, pa
+
+NUM_ROWS = 200_000
+MODELS = [
+    "llama-3.1-sonar-small-128k-online",
+    "llama-3.1-sonar-large-128k-online",
+]
+
+
+def make_response(i: int) -> dict:
+    return {
+        "id": f"resp-{i}",
+        "model": MODELS[i % 2],
+        "object": "chat.completion",
+        "created": 1700000000 + i,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": f"answer {i}"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 12,
+            "completion_tokens": 240,
+            "total_tokens": 252,
+        },
+        "citations": [
+            f"https://www.source{(i + j) % 300}.example.com/a/{i}"
+            for j in range(5)
+        ],
+    }
+
+
+def main():
+    responses = [make_response(i) for i in range(NUM_ROWS)]
+    formats = ["csv"] + (["parquet"] if pa is not None else [])
+    with tempfile.TemporaryDirectory() as tmp:
+        for format in formats:
+            path = Path(tmp) / f"completions.{format}"
+            start = time.perf_counter()
+            with CompletionColumnarSink(path, format=format) as sink:
+                sink.extend(responses)
+            elapsed = time.perf_counter() - start
+            print(
+                f"{format:<8} {NUM_ROWS / elapsed:10,.0f} rows/s "
+                f"{path.stat().st_size / NUM_ROWS:6.1f} B/row"
+            )
+        print(sink.tokens_by_model())
+        print(sink.cost_by_model())
+        print(sink.citation_domain_histogram(3))
+
+
+if __name__ == "__main__":
+    main()
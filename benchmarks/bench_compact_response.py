@@ -0,0 +1,94 @@
+"""Memory and construction cost of compact vs Pydantic responses.
+
+Run with ``python benchmarks/bench_compact_response.py``.
+"""
+
+import gc
+import time
+import tracemalloc
+
+from lion_perplexity.api_endpoints.chat_completions.response.compact import (
+    CitationTable,
+    CompactChatCompletion,
+)
+from lion_perplexity.api_endpoints.chat_completions.response.response_body import (
+    PerplexityChatCompletionResponseBody,
+)
+
+NUM_RESPONSES = 20_000
+NUM_SOURCES = 500
+
+
+def make_response(i: int) -> dict:
+    return {
+        "id": f"resp-{i}",
+        "model": "llama-3.1-sonar-small-128k-online",
+        "object": "chat.completion",
+        "created": 1700000000 + i,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": f"answer {i}"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 12,
+            "completion_tokens": 240,
+            "total_tokens": 252,
+        },
+        "citations": [
+            f"https://source{(i + j) % NUM_SOURCES}.example.com/article"
+            for j in range(8)
+        ],
+        "related_questions": [{"text": "What else?"}],
+    }
+
+
+def measure(label, build, raw):
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    kept = [build(r) for r in raw]
+    elapsed = time.perf_counter() - start
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{label:<28} {size / len(kept):8.0f} B/response "
+        f"{len(kept) / elapsed:10,.0f} responses/s"
+    )
+    return kept
+
+
+def main():
+    raw = [make_response(i) for i in range(NUM_RESPONSES)]
+    models = measure(
+        "pydantic (validated)",
+        lambda r: PerplexityChatCompletionResponseBody(**r),
+        raw,
+    )
+
+    table = CitationTable()
+    measure(
+        "compact from raw dict",
+        lambda r: CompactChatCompletion.from_response(r, table),
+        raw,
+    )
+    table = CitationTable()
+    compact = measure(
+        "compact from pydantic",
+        lambda m: CompactChatCompletion.from_model(m, table),
+        models,
+    )
+
+    start = time.perf_counter()
+    for c in compact:
+        c.to_model()
+    elapsed = time.perf_counter() - start
+    print(
+        f"{'compact -> pydantic':<28} {'':>19} {len(compact) / elapsed:10,.0f} responses/s"
+    )
+
+
+if __name__ == "__main__":
+    main()
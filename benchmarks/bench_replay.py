@@ -0,0 +1,110 @@
+"""Throughput of ``ReplayTransport`` serving a recorded archive.
+
+Run with ``python benchmarks/bench_replay.py``.
+"""
+
+import asyncio
+import json
+import tempfile
+import time
+from pathlib import Path
+
+from lion_perplexity.api_endpoints.api_request import PerplexityRequest
+from lion_perplexity.api_endpoints.record_replay import (
+    ReplayTransport,
+    TrafficArchive,
+    request_key,
+)
+
+URL = "https://api.perplexity.ai/chat/completions"
+NUM_DISTINCT = 1_000
+NUM_REQUESTS = 50_000
+
+
+def make_body(i: int) -> dict:
+    return {
+        "model": "llama-3.1-sonar-small-128k-online",
+        "messages": [{"role": "user", "content": f"question {i}"}],
+    }
+
+
+def make_response(i: int) -> dict:
+    return {
+        "id": f"resp-{i}",
+        "model": "llama-3.1-sonar-small-128k-online",
+        "object": "chat.completion",
+        "created": 1700000000,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "answer " * 50},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 10,
+            "completion_tokens": 60,
+            "total_tokens": 70,
+        },
+        "citations": [f"https://example.com/{i}/{j}" for j in range(5)],
+    }
+
+
+def build_archive(path: Path) -> None:
+    with TrafficArchive(path, "w") as archive:
+        for i in range(NUM_DISTINCT):
+            archive.append(
+                request_key("POST", URL, make_body(i)),
+                status=200,
+                headers={"content-type": "application/json"},
+                body=json.dumps(make_response(i)).encode(),
+            )
+
+
+async def bench_transport(transport: ReplayTransport) -> float:
+    bodies = [
+        json.dumps(make_body(i % NUM_DISTINCT)).encode()
+        for i in range(NUM_REQUESTS)
+    ]
+    start = time.perf_counter()
+    for body in bodies:
+        await transport.request("POST", URL, {}, body)
+    return NUM_REQUESTS / (time.perf_counter() - start)
+
+
+async def bench_request(request: PerplexityRequest) -> float:
+    bodies = [make_body(i % NUM_DISTINCT) for i in range(NUM_REQUESTS)]
+
+    async def worker(chunk):
+        for body in chunk:
+            await request.invoke(json_data=body)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(bodies[i::64]) for i in range(64)))
+    return NUM_REQUESTS / (time.perf_counter() - start)
+
+
+async def main():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "traffic.lpx"
+        build_archive(path)
+        print(f"archive: {path.stat().st_size / NUM_DISTINCT:.0f} B/record")
+
+        with TrafficArchive(path) as archive:
+            transport = ReplayTransport(archive=archive)
+            request = PerplexityRequest(
+                api_key="key",
+                endpoint="chat/completions",
+                method="POST",
+                transport=transport,
+            )
+            print(
+                f"transport only:     {await bench_transport(transport):,.0f} req/s"
+            )
+            print(
+                f"PerplexityRequest:  {await bench_request(request):,.0f} req/s"
+            )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+"""Sync client vs. ``asyncio.run`` per call.
+
+Starts a local aiohttp server that answers like the chat completions
+endpoint, then times blocking calls made (1) with ``asyncio.run`` around
+each ``PerplexityModel.invoke``, the pattern used in Flask/Celery
+workers, (2) through one ``SyncPerplexityClient`` and (3) through the
+same client from several threads at once.
+
+Run with ``python benchmarks/bench_sync_client.py``.
+"""
+
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from aiohttp import web
+
+from lion_perplexity.api_endpoints.chat_completions.request.request_body import (
+    PerplexityChatCompletionRequestBody,
+)
+from lion_perplexity.PerplexityModel import PerplexityModel
+from lion_perplexity.sync_client import SyncPerplexityClient
+
+MODEL = "llama-3.1-sonar-small-128k-online"
+NUM_CALLS = 500
+NUM_THREADS = 8
+PORT = 8765
+
+RESPONSE = {
+    "id": "resp",
+    "model": MODEL,
+    "object": "chat.completion",
+    "created": 1700000000,
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "answer"},
+            "finish_reason": "stop",
+        }
+    ],
+    "usage": {"prompt_tokens": 5, "completion_tokens": 5, "total_tokens": 10},
+}
+
+
+def start_server() -> None:
+    async def handler(request):
+        await request.read()
+        return web.json_response(RESPONSE)
+
+    async def serve():
+        app = web.Application()
+        app.router.add_post("/chat/completions", handler)
+        runner = web.AppRunner(app, access_log=None)
+        await runner.setup()
+        await web.TCPSite(runner, "127.0.0.1", PORT).start()
+        ready.set()
+        await asyncio.Event().wait()
+
+    ready = threading.Event()
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    ready.wait()
+
+
+def make_model() -> PerplexityModel:
+    model = PerplexityModel(
+        model=MODEL,
+        api_key="key",
+        endpoint="chat/completions",
+        method="POST",
+        content_type="application/json",
+    )
+    model.request_model.base_url = f"http://127.0.0.1:{PORT}"
+    return model
+
+
+def make_body() -> PerplexityChatCompletionRequestBody:
+    return PerplexityChatCompletionRequestBody(
+        model=MODEL,
+        messages=[{"role": "user", "content": "question"}],
+        max_tokens=16,
+    )
+
+
+def report(label: str, elapsed: float) -> None:
+    print(
+        f"{label:<26} {NUM_CALLS / elapsed:8,.0f} calls/s "
+        f"{elapsed / NUM_CALLS * 1e3:7.2f} ms/call"
+    )
+
+
+def main():
+    start_server()
+    body = make_body()
+
+    model = make_model()
+    start = time.perf_counter()
+    for _ in range(NUM_CALLS):
+        asyncio.run(model.invoke(body))
+    report("asyncio.run per call", time.perf_counter() - start)
+
+    with SyncPerplexityClient(make_model()) as client:
+        client.invoke(body)  # warm up the pooled session
+        start = time.perf_counter()
+        for _ in range(NUM_CALLS):
+            client.invoke(body)
+        report("sync client, 1 thread", time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(NUM_THREADS) as pool:
+            list(pool.map(lambda _: client.invoke(body), range(NUM_CALLS)))
+        report(
+            f"sync client, {NUM_THREADS} threads", time.perf_counter() - start
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,15 @@
 #
 # SPDX-License-Identifier: Apache-2.0
 
+import asyncio
+import json
 import os
+import time
+from functools import lru_cache
 from pathlib import Path
 
 import yaml
 from lion_service.rate_limiter import RateLimiter, RateLimitError
-from lion_service.service_util import invoke_retry
 from lion_service.token_calculator import TiktokenCalculator
 from pydantic import (
     BaseModel,
@@ -21,7 +24,11 @@ from .api_endpoints.api_request import PerplexityRequest
 from .api_endpoints.chat_completions.request.request_body import (
     PerplexityChatCompletionRequestBody,
 )
+from .api_endpoints.circuit_breaker import CircuitBreaker
+from .api_endpoints.coalescer import RequestCoalescer
 from .api_endpoints.match_response import match_response
+from .api_endpoints.output_estimator import OutputLengthEstimator
+from .api_endpoints.retry import RetryEngine, StreamInterruptedError
 
 path = Path(__file__).parent
 
@@ -29,6 +36,18 @@ price_config_file_name = path / "perplexity_price_data.yaml"
 max_output_token_file_name = path / "perplexity_max_output_token_data.yaml"
 
 
+@lru_cache
+def load_price_config() -> dict:
+    with open(price_config_file_name) as file:
+        return yaml.safe_load(file)
+
+
+@lru_cache
+def load_max_output_token_config() -> dict:
+    with open(max_output_token_file_name) as file:
+        return yaml.safe_load(file)
+
+
 class PerplexityModel(BaseModel):
     model: str = Field(description="ID of the model to use.")
 
@@ -46,6 +65,38 @@ class PerplexityModel(BaseModel):
         default=0, description="Expected output len before making request"
     )
 
+    capacity_timeout: float = Field(
+        default=60,
+        ge=0,
+        description="Seconds to wait for rate limit capacity",
+    )
+
+    capacity_poll_interval: float = Field(
+        default=2,
+        gt=0,
+        description="Seconds between rate limit capacity checks",
+    )
+
+    retry_engine: RetryEngine = Field(
+        default_factory=RetryEngine,
+        description="Retries the network step of prepared requests",
+    )
+
+    circuit_breaker: CircuitBreaker | None = Field(
+        default=None,
+        description="Fails fast while the upstream is unhealthy",
+    )
+
+    coalescer: RequestCoalescer | None = Field(
+        default=None,
+        description="Shares identical in-flight requests",
+    )
+
+    output_estimator: OutputLengthEstimator | None = Field(
+        default_factory=OutputLengthEstimator,
+        description="Learns output reservations from observed usage",
+    )
+
     model_config = ConfigDict(extra="forbid")
 
     @model_validator(mode="before")
@@ -67,6 +118,8 @@ class PerplexityModel(BaseModel):
                 request_model_params["api_key"] = api_key
         except Exception:
             pass
+        if transport := data.pop("transport", None):
+            request_model_params["transport"] = transport
 
         data["request_model"] = PerplexityRequest(**request_model_params)
 
@@ -94,96 +147,208 @@ class PerplexityModel(BaseModel):
     def serialize_request_model(self, value: PerplexityRequest):
         return value.model_dump(exclude_unset=True)
 
-    @invoke_retry(max_retries=3, base_delay=1, max_delay=60)
-    async def invoke(
+    async def admit(
         self,
         request_body: PerplexityChatCompletionRequestBody,
         estimated_output_len: int = 0,
-        output_file=None,
-        parse_response=True,
-    ):
+    ) -> tuple[int, int]:
+        """Validate, count tokens and wait for rate limit capacity.
+
+        Returns the input token length and the output length reserved.
+        With an output estimator the tokens are held until the caller
+        passes the response to its ``reconcile``.
+        """
         if request_model := getattr(request_body, "model"):
             if request_model != self.model:
                 raise ValueError(
                     f"Request model does not match. Model is {self.model}, but request is made for {request_model}."
                 )
 
-        # check remaining rate limit
         input_token_len = await self.get_input_token_len(request_body)
 
         if getattr(request_body, "max_tokens", None):
             estimated_output_len = request_body.max_tokens
-
-        invoke_viability_result = self.verify_invoke_viability(
-            input_tokens_len=input_token_len,
-            estimated_output_len=estimated_output_len,
+        estimated_output_len = self.resolve_estimated_output_len(
+            estimated_output_len, input_tokens_len=input_token_len
         )
-        if not invoke_viability_result:
-            raise RateLimitError(
-                message="Rate limit reached for requests",
-                input_token_len=input_token_len,
+
+        await self.wait_for_capacity(input_token_len, estimated_output_len)
+        if self.output_estimator is not None:
+            self.output_estimator.hold(input_token_len, estimated_output_len)
+        return input_token_len, estimated_output_len
+
+    async def invoke(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        estimated_output_len: int = 0,
+        output_file=None,
+        parse_response=True,
+    ):
+        if getattr(request_body, "stream", None):
+            response_chunks = []
+            async for chunk in self.open_stream(
+                request_body,
                 estimated_output_len=estimated_output_len,
+                output_file=output_file,
+                verbose=True,
+            ):
+                response_chunks.append(chunk)
+
+            if parse_response:
+                return match_response(self.request_model, response_chunks)
+            return response_chunks
+
+        body_bytes = request_body.model_dump_json(exclude_unset=True).encode(
+            "utf-8"
+        )
+        if self.coalescer is not None and not output_file:
+            response_body, _ = await self.coalescer.run(
+                self.coalescer.key(body_bytes),
+                lambda: self._invoke_prepared(
+                    request_body, body_bytes, estimated_output_len
+                ),
+            )
+        else:
+            response_body = await self._invoke_prepared(
+                request_body, body_bytes, estimated_output_len, output_file
             )
 
+        if parse_response:
+            return match_response(self.request_model, response_body)
+        else:
+            return response_body
+
+    async def _invoke_prepared(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        body_bytes: bytes,
+        estimated_output_len: int = 0,
+        output_file=None,
+    ):
+        # prepare once; retries below only repeat the network step
+        input_token_len, reserved = await self.admit(
+            request_body, estimated_output_len
+        )
+
+        response_body = None
         try:
-            if getattr(request_body, "stream", None):
-                return await self.stream(
-                    request_body,
+            response_body, response_headers = await self.retry_engine.run(
+                lambda: self.request_model.invoke(
+                    json_data=body_bytes,
                     output_file=output_file,
-                    parse_response=parse_response,
-                )
-
-            response_body, response_headers = await self.request_model.invoke(
-                json_data=request_body,
-                output_file=output_file,
-                with_response_header=True,
-                parse_response=False,
+                    with_response_header=True,
+                    parse_response=False,
+                ),
+                circuit_breaker=self.circuit_breaker,
             )
+        finally:
+            if self.output_estimator is not None:
+                self.output_estimator.reconcile(
+                    input_token_len, reserved, response_body
+                )
 
-            if response_body:
-                # Update rate limit based on usage
-                if response_body.get("usage"):
-                    total_token_usage = response_body["usage"]["total_tokens"]
-                    if date_str := response_headers.get("date"):
-                        self.rate_limiter.update_rate_limit(
-                            date_str, total_token_usage
-                        )
-                    else:
-                        self.rate_limiter.update_rate_limit(
-                            None, total_token_usage
-                        )
+        if response_body:
+            # Update rate limit based on usage
+            if response_body.get("usage"):
+                total_token_usage = response_body["usage"]["total_tokens"]
+                if date_str := response_headers.get("date"):
+                    self.rate_limiter.update_rate_limit(
+                        date_str, total_token_usage
+                    )
                 else:
-                    self.rate_limiter.update_rate_limit(None)
-
-            if parse_response:
-                return match_response(self.request_model, response_body)
+                    self.rate_limiter.update_rate_limit(
+                        None, total_token_usage
+                    )
             else:
-                return response_body
+                self.rate_limiter.update_rate_limit(None)
 
-        except Exception as e:
-            raise e
+        return response_body
 
-    async def stream(
+    async def open_stream(
         self,
         request_body: PerplexityChatCompletionRequestBody,
+        estimated_output_len: int = 0,
         output_file=None,
-        parse_response=True,
-        verbose=True,
+        verbose=False,
     ):
+        """Admit a streaming request and yield its chunks.
+
+        With a coalescer, an identical stream already in flight is joined
+        instead: its chunks so far are replayed, then the live tail, and
+        admission and usage accounting happen only once. ``verbose``
+        prints deltas as they arrive from upstream, so a joined stream is
+        printed once, by the call that opened it.
+        """
+
+        async def admitted_stream():
+            input_token_len, reserved = await self.admit(
+                request_body, estimated_output_len
+            )
+            chunk = None
+            try:
+                async for chunk in self.iter_stream(
+                    request_body, output_file=output_file, verbose=verbose
+                ):
+                    yield chunk
+            finally:
+                if self.output_estimator is not None:
+                    self.output_estimator.reconcile(
+                        input_token_len, reserved, chunk
+                    )
+
+        if self.coalescer is None or output_file:
+            chunks = admitted_stream()
+        else:
+            chunks = self.coalescer.stream(
+                self.coalescer.key(request_body), admitted_stream
+            )
+        async for chunk in chunks:
+            yield chunk
+
+    async def iter_stream(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        output_file=None,
+        verbose=False,
+    ):
+        """Yield stream chunks as they arrive.
+
+        Rate limit usage is recorded once the stream has finished. Does
+        not call ``admit``; ``open_stream`` does that first.
+        """
         response_chunks = []
-        response_headers = None
+        response_headers = {}
 
-        async for chunk in self.request_model.stream(
-            json_data=request_body,
-            output_file=output_file,
-            with_response_header=True,
-            verbose=verbose,
-        ):
-            if isinstance(chunk, dict):
-                if "headers" in chunk:
-                    response_headers = chunk["headers"]
-                else:
-                    response_chunks.append(chunk)
+        json_data = request_body.model_dump(exclude_unset=True)
+        json_data["stream"] = True
+        body_bytes = json.dumps(json_data).encode("utf-8")
+
+        try:
+            async for chunk in self.retry_engine.stream(
+                lambda: self.request_model.stream(
+                    json_data=body_bytes,
+                    output_file=output_file,
+                    with_response_header=True,
+                    verbose=False,
+                ),
+                circuit_breaker=self.circuit_breaker,
+            ):
+                if isinstance(chunk, dict):
+                    if "headers" in chunk:
+                        response_headers = chunk["headers"]
+                    else:
+                        if verbose and "choices" in chunk:
+                            content = chunk["choices"][0]["delta"]["content"]
+                            print(content, end="", flush=True)
+                        response_chunks.append(chunk)
+                        yield chunk
+        except Exception as e:
+            if response_chunks and not isinstance(e, StreamInterruptedError):
+                raise StreamInterruptedError(
+                    f"Stream interrupted after {len(response_chunks)} chunks: {e}",
+                    chunks=response_chunks,
+                ) from e
+            raise e
 
         # Update rate limit if we have usage information
         if response_chunks and response_chunks[-1].get("usage"):
@@ -195,6 +360,20 @@ class PerplexityModel(BaseModel):
             else:
                 self.rate_limiter.update_rate_limit(None, total_token_usage)
 
+    async def stream(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        output_file=None,
+        parse_response=True,
+        verbose=True,
+    ):
+        response_chunks = [
+            chunk
+            async for chunk in self.iter_stream(
+                request_body, output_file=output_file, verbose=verbose
+            )
+        ]
+
         if parse_response:
             return match_response(self.request_model, response_chunks)
         else:
@@ -217,21 +396,46 @@ class PerplexityModel(BaseModel):
 
         return total_tokens
 
+    def resolve_estimated_output_len(
+        self, estimated_output_len: int = 0, input_tokens_len: int = 0
+    ):
+        if estimated_output_len != 0:
+            return estimated_output_len
+        if self.estimated_output_len == 0:
+            self.estimated_output_len = load_max_output_token_config().get(
+                self.model, 0
+            )
+        if self.output_estimator is not None and (
+            predicted := self.output_estimator.estimate(input_tokens_len)
+        ):
+            # never reserve beyond the static maximum
+            if self.estimated_output_len:
+                return min(predicted, self.estimated_output_len)
+            return predicted
+        return self.estimated_output_len
+
     def verify_invoke_viability(
         self, input_tokens_len: int = 0, estimated_output_len: int = 0
     ):
         self.rate_limiter.release_tokens()
 
-        estimated_output_len = (
-            estimated_output_len
-            if estimated_output_len != 0
-            else self.estimated_output_len
+        estimated_output_len = self.resolve_estimated_output_len(
+            estimated_output_len, input_tokens_len=input_tokens_len
         )
-        if estimated_output_len == 0:
-            with open(max_output_token_file_name) as file:
-                output_token_config = yaml.safe_load(file)
-                estimated_output_len = output_token_config.get(self.model, 0)
-                self.estimated_output_len = estimated_output_len
+
+        # reservations of admitted calls are not in the limiter yet
+        if self.output_estimator is not None:
+            input_tokens_len += self.output_estimator.in_flight_tokens
+
+        # before the first usage is recorded the limiter does not track
+        # remaining tokens and would admit anything
+        limit_tokens = self.rate_limiter.limit_tokens
+        if (
+            self.rate_limiter.remaining_tokens is None
+            and limit_tokens
+            and input_tokens_len + estimated_output_len > limit_tokens
+        ):
+            return False
 
         if self.rate_limiter.check_availability(
             input_tokens_len, estimated_output_len
@@ -240,6 +444,47 @@ class PerplexityModel(BaseModel):
         else:
             return False
 
+    async def wait_for_capacity(
+        self, input_tokens_len: int, estimated_output_len: int
+    ):
+        """Wait until the rate limiter admits the request.
+
+        Polls every ``capacity_poll_interval`` seconds while earlier usage
+        is pending release or admitted calls hold reservations, for at
+        most ``capacity_timeout`` seconds, then raises ``RateLimitError``.
+        """
+        requested_tokens = input_tokens_len + estimated_output_len
+        deadline = time.monotonic() + self.capacity_timeout
+        while True:
+            if self.verify_invoke_viability(
+                input_tokens_len=input_tokens_len,
+                estimated_output_len=estimated_output_len,
+            ):
+                return
+
+            limit_tokens = self.rate_limiter.limit_tokens
+            if limit_tokens and requested_tokens > limit_tokens:
+                raise ValueError(
+                    "Requested tokens exceed the model's token limit. "
+                    "Please modify the input, adjust the expected output tokens, or increase the token limit. "
+                    f"The current token limit is {limit_tokens} tokens."
+                )
+
+            pending = self.rate_limiter.unreleased_requests or (
+                self.output_estimator is not None
+                and self.output_estimator.in_flight_tokens
+            )
+            remaining = deadline - time.monotonic()
+            if not pending or remaining <= 0:
+                break
+            await asyncio.sleep(min(self.capacity_poll_interval, remaining))
+
+        raise RateLimitError(
+            message="Rate limit reached for requests",
+            input_token_len=input_tokens_len,
+            estimated_output_len=estimated_output_len,
+        )
+
     def estimate_text_price(
         self,
         input_text: str,
@@ -250,10 +495,7 @@ class PerplexityModel(BaseModel):
 
         num_of_input_tokens = self.text_token_calculator.calculate(input_text)
 
-        with open(price_config_file_name) as file:
-            price_config = yaml.safe_load(file)
-
-        model_price_info_dict = price_config["model"][self.model]
+        model_price_info_dict = load_price_config()["model"][self.model]
         estimated_price = (
             model_price_info_dict["input_tokens"] * num_of_input_tokens
             + model_price_info_dict["output_tokens"]
@@ -10,6 +10,10 @@ from lion_service import Service, register_service
 from .api_endpoints.chat_completions.request.request_body import (
     PerplexityChatCompletionRequestBody,
 )
+from .api_endpoints.circuit_breaker import CircuitBreaker
+from .api_endpoints.coalescer import RequestCoalescer
+from .api_endpoints.transport import Transport
+from .fan_out import ChatCompletionFanOut
 from .PerplexityModel import PerplexityModel
 
 load_dotenv()
@@ -26,6 +30,11 @@ class PerplexityService(Service):
         self.api_key = api_key
         self.name = name
         self.rate_limiters = {}  # model: RateLimiter
+        self.retry_engines = {}  # model: RetryEngine
+        self.output_estimators = {}  # model: OutputLengthEstimator
+        # (base_url, endpoint, model): CircuitBreaker
+        self.circuit_breakers = {}
+        self.coalescers = {}  # model: RequestCoalescer
         super().__setattr__("_initialized", True)
 
     def __setattr__(self, key, value):
@@ -65,8 +74,42 @@ class PerplexityService(Service):
             if limit_tokens:
                 perplexity_model.rate_limiter.limit_tokens = limit_tokens
 
+        # retry budgets are shared the same way, so one degraded model
+        # cannot be retried from several model objects at once
+        if model not in self.retry_engines:
+            self.retry_engines[model] = perplexity_model.retry_engine
+        else:
+            perplexity_model.retry_engine = self.retry_engines[model]
+
+        # output lengths are learned from all traffic to the model
+        if model not in self.output_estimators:
+            self.output_estimators[model] = perplexity_model.output_estimator
+        else:
+            perplexity_model.output_estimator = self.output_estimators[model]
+
+        return perplexity_model
+
+    def check_circuit_breaker(self, perplexity_model: PerplexityModel):
+        request_model = perplexity_model.request_model
+        key = (
+            request_model.base_url,
+            request_model.endpoint,
+            perplexity_model.model,
+        )
+        if key not in self.circuit_breakers:
+            self.circuit_breakers[key] = (
+                perplexity_model.circuit_breaker or CircuitBreaker()
+            )
+        perplexity_model.circuit_breaker = self.circuit_breakers[key]
         return perplexity_model
 
+    def health(self) -> dict[tuple[str, str, str], dict]:
+        """Circuit state per (base_url, endpoint, model) upstream."""
+        return {
+            key: breaker.health()
+            for key, breaker in self.circuit_breakers.items()
+        }
+
     @staticmethod
     def match_data_model(task_name: str) -> dict:
         """Match task name to appropriate request and response models."""
@@ -84,6 +127,9 @@ class PerplexityService(Service):
                 "__init__",
                 "__setattr__",
                 "check_rate_limiter",
+                "check_circuit_breaker",
+                "health",
+                "fan_out_chat_completion",
                 "match_data_model",
             ]:
                 methods.append(name)
@@ -91,8 +137,19 @@ class PerplexityService(Service):
 
     # Chat Completions
     def create_chat_completion(
-        self, model: str, limit_tokens: int = None, limit_requests: int = None
+        self,
+        model: str,
+        limit_tokens: int = None,
+        limit_requests: int = None,
+        transport: Transport = None,
+        coalesce: bool = False,
     ):
+        """Create a model object bound to this service's shared state.
+
+        With ``coalesce=True`` identical requests in flight at the same
+        time, from any model object created this way, share one upstream
+        call; see ``service.coalescers[model].stats`` for the savings.
+        """
         model_obj = PerplexityModel(
             model=model,
             api_key=self.api_key,
@@ -101,11 +158,53 @@ class PerplexityService(Service):
             content_type="application/json",
             limit_tokens=limit_tokens,
             limit_requests=limit_requests,
+            transport=transport,
         )
 
-        return self.check_rate_limiter(
+        model_obj = self.check_rate_limiter(
             model_obj, limit_requests=limit_requests, limit_tokens=limit_tokens
         )
+        if coalesce:
+            model_obj.coalescer = self.coalescers.setdefault(
+                model, RequestCoalescer()
+            )
+        return self.check_circuit_breaker(model_obj)
+
+    def fan_out_chat_completion(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        variants: list[dict],
+        quorum: int = None,
+        token_budget: int = None,
+        max_concurrency: int = None,
+        limit_tokens: int = None,
+        limit_requests: int = None,
+    ) -> ChatCompletionFanOut:
+        """Split one request into sub-queries run concurrently.
+
+        Each variant is a dict of request fields (e.g.
+        ``search_domain_filter``, ``search_recency_filter``) overriding
+        ``request_body``. The sub-queries share this service's rate
+        limiter for the model. Iterate the returned fan-out for partial
+        results or await its ``merged()`` for the combined answer.
+        """
+        base = request_body.model_dump(exclude_unset=True)
+        request_bodies = [
+            PerplexityChatCompletionRequestBody(**{**base, **variant})
+            for variant in variants
+        ]
+        model_obj = self.create_chat_completion(
+            request_body.model,
+            limit_tokens=limit_tokens,
+            limit_requests=limit_requests,
+        )
+        return ChatCompletionFanOut(
+            model_obj,
+            request_bodies,
+            quorum=quorum,
+            token_budget=token_budget,
+            max_concurrency=max_concurrency,
+        )
 
     @property
     def allowed_roles(self):
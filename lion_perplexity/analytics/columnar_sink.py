@@ -0,0 +1,355 @@
+import csv
+import math
+import os
+from collections import Counter
+from typing import Any
+
+from lion_perplexity.analytics.citation_index import citation_domain
+from lion_perplexity.api_endpoints.chat_completions.response.compact import (
+    CompactChatCompletion,
+)
+from lion_perplexity.api_endpoints.chat_completions.response.response_body import (
+    PerplexityChatCompletionResponseBody,
+)
+from lion_perplexity.PerplexityModel import load_price_config
+
+try:
+    import numpy as np
+except ImportError:  # pragma: no cover - optional dependency
+    np = None
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:  # pragma: no cover - optional dependency
+    pa = None
+    pq = None
+
+COLUMNS = (
+    "id",
+    "model",
+    "created",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+    "finish_reason",
+    "content",
+    "citation_urls",
+)
+
+_INT_COLUMNS = (
+    "created",
+    "prompt_tokens",
+    "completion_tokens",
+    "total_tokens",
+)
+
+
+def _citation_url(citation) -> str | None:
+    if isinstance(citation, str):
+        return citation
+    if isinstance(citation, dict):
+        return citation.get("url")
+    return getattr(citation, "url", None)
+
+
+def _tolist(values) -> list:
+    return values.tolist() if hasattr(values, "tolist") else values
+
+
+class CompletionColumnarSink:
+    """Batch chat completions into columns and write them out.
+
+    Rows accumulate in per-column buffers and are flushed every
+    ``batch_size`` rows, so memory stays bounded regardless of how many
+    completions pass through. With ``pyarrow`` installed the output is a
+    Parquet file with one row group per batch; otherwise a CSV file is
+    written, with citation URLs space-joined.
+
+    Aggregates (tokens and cost per model, citation domain counts) are
+    folded in at each flush, with vectorised NumPy operations when NumPy
+    is installed, and remain available after the raw rows have been
+    written. Both libraries come with the ``analytics`` extra. A closed
+    sink cannot be written to again.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        format: str = "auto",
+        batch_size: int = 10_000,
+    ):
+        if format == "auto":
+            format = "parquet" if pa is not None else "csv"
+        if format not in ("parquet", "csv"):
+            raise ValueError("Format must be one of 'auto', 'parquet', 'csv'")
+        if format == "parquet" and pa is None:
+            raise ImportError(
+                "Parquet output requires pyarrow. "
+                "Install it with `pip install lion-perplexity[analytics]`."
+            )
+        if batch_size <= 0:
+            raise ValueError("Batch size must be a positive integer")
+
+        self.path = os.fspath(path)
+        self.format = format
+        self.batch_size = batch_size
+        self.rows_written = 0
+
+        self.price_config = load_price_config()["model"]
+
+        self._buffers: dict[str, list] = {c: [] for c in COLUMNS}
+        self._model_totals: dict[str, Any] = {}
+        self._domain_counts: Counter = Counter()
+        self._writer = None
+        self._file = None
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return len(self._buffers["id"])
+
+    def add(
+        self,
+        response: (
+            PerplexityChatCompletionResponseBody
+            | CompactChatCompletion
+            | dict[str, Any]
+        ),
+    ) -> None:
+        if self._closed:
+            raise ValueError("Sink is closed")
+        buffers = self._buffers
+        if isinstance(response, CompactChatCompletion):
+            choice = response.choices[0]
+            buffers["id"].append(response.id)
+            buffers["model"].append(response.model)
+            buffers["created"].append(response.created)
+            buffers["prompt_tokens"].append(response.prompt_tokens)
+            buffers["completion_tokens"].append(response.completion_tokens)
+            buffers["total_tokens"].append(response.total_tokens)
+            buffers["finish_reason"].append(choice.finish_reason)
+            buffers["content"].append(choice.content)
+            buffers["citation_urls"].append(response.citation_urls)
+        elif isinstance(response, PerplexityChatCompletionResponseBody):
+            choice = response.choices[0]
+            buffers["id"].append(response.id)
+            buffers["model"].append(response.model)
+            buffers["created"].append(response.created)
+            buffers["prompt_tokens"].append(response.usage.prompt_tokens)
+            buffers["completion_tokens"].append(
+                response.usage.completion_tokens
+            )
+            buffers["total_tokens"].append(response.usage.total_tokens)
+            buffers["finish_reason"].append(choice.finish_reason)
+            buffers["content"].append(choice.message.content)
+            buffers["citation_urls"].append(
+                [_citation_url(c) for c in response.citations or ()]
+            )
+        else:
+            choice = response["choices"][0]
+            usage = response["usage"]
+            buffers["id"].append(response["id"])
+            buffers["model"].append(response["model"])
+            buffers["created"].append(response["created"])
+            buffers["prompt_tokens"].append(usage["prompt_tokens"])
+            buffers["completion_tokens"].append(usage["completion_tokens"])
+            buffers["total_tokens"].append(usage["total_tokens"])
+            buffers["finish_reason"].append(choice.get("finish_reason"))
+            buffers["content"].append(choice["message"]["content"])
+            buffers["citation_urls"].append(
+                [_citation_url(c) for c in response.get("citations") or ()]
+            )
+
+        if len(buffers["id"]) >= self.batch_size:
+            self.flush()
+
+    def extend(self, responses) -> None:
+        for response in responses:
+            self.add(response)
+
+    def flush(self) -> None:
+        if self._closed:
+            raise ValueError("Sink is closed")
+        if not self._buffers["id"]:
+            return
+
+        columns = {
+            name: (
+                np.asarray(values, dtype=np.int64)
+                if np is not None and name in _INT_COLUMNS
+                else values
+            )
+            for name, values in self._buffers.items()
+        }
+        self._aggregate(columns)
+        if self.format == "parquet":
+            self._write_parquet(columns)
+        else:
+            self._write_csv(columns)
+
+        self.rows_written += len(columns["id"])
+        self._buffers = {c: [] for c in COLUMNS}
+
+    def _aggregate(self, columns: dict[str, Any]) -> None:
+        if np is None:
+            self._aggregate_python(columns)
+            return
+
+        models, inverse = np.unique(
+            np.asarray(columns["model"], dtype=object), return_inverse=True
+        )
+        sums = np.stack(
+            [
+                np.bincount(inverse, minlength=len(models)),
+                np.bincount(
+                    inverse,
+                    weights=columns["prompt_tokens"],
+                    minlength=len(models),
+                ),
+                np.bincount(
+                    inverse,
+                    weights=columns["completion_tokens"],
+                    minlength=len(models),
+                ),
+                np.bincount(
+                    inverse,
+                    weights=columns["total_tokens"],
+                    minlength=len(models),
+                ),
+            ],
+            axis=1,
+        ).astype(np.int64)
+        for model, row in zip(models, sums):
+            if model in self._model_totals:
+                self._model_totals[model] += row
+            else:
+                self._model_totals[model] = row
+
+        urls = [u for urls in columns["citation_urls"] for u in urls if u]
+        if urls:
+            domains, counts = np.unique(
+                np.asarray([citation_domain(u) for u in urls], dtype=object),
+                return_counts=True,
+            )
+            self._domain_counts.update(dict(zip(domains, counts.tolist())))
+
+    def _aggregate_python(self, columns: dict[str, Any]) -> None:
+        for model, prompt, completion, total in zip(
+            columns["model"],
+            columns["prompt_tokens"],
+            columns["completion_tokens"],
+            columns["total_tokens"],
+        ):
+            row = self._model_totals.setdefault(model, [0, 0, 0, 0])
+            row[0] += 1
+            row[1] += prompt
+            row[2] += completion
+            row[3] += total
+
+        self._domain_counts.update(
+            citation_domain(u)
+            for urls in columns["citation_urls"]
+            for u in urls
+            if u
+        )
+
+    def _write_parquet(self, columns: dict[str, Any]) -> None:
+        batch = pa.RecordBatch.from_pydict(
+            {
+                "id": pa.array(columns["id"], pa.string()),
+                "model": pa.array(
+                    columns["model"], pa.string()
+                ).dictionary_encode(),
+                "created": pa.array(columns["created"], pa.int64()),
+                "prompt_tokens": pa.array(
+                    columns["prompt_tokens"], pa.int64()
+                ),
+                "completion_tokens": pa.array(
+                    columns["completion_tokens"], pa.int64()
+                ),
+                "total_tokens": pa.array(columns["total_tokens"], pa.int64()),
+                "finish_reason": pa.array(
+                    columns["finish_reason"], pa.string()
+                ).dictionary_encode(),
+                "content": pa.array(columns["content"], pa.string()),
+                "citation_urls": pa.array(
+                    columns["citation_urls"], pa.list_(pa.string())
+                ),
+            }
+        )
+        if self._writer is None:
+            self._writer = pq.ParquetWriter(self.path, batch.schema)
+        self._writer.write_batch(batch)
+
+    def _write_csv(self, columns: dict[str, Any]) -> None:
+        if self._file is None:
+            self._file = open(self.path, "w", newline="", encoding="utf-8")
+            self._writer = csv.writer(self._file)
+            self._writer.writerow(COLUMNS)
+        self._writer.writerows(
+            zip(
+                columns["id"],
+                columns["model"],
+                *(_tolist(columns[name]) for name in _INT_COLUMNS),
+                columns["finish_reason"],
+                columns["content"],
+                [" ".join(urls) for urls in columns["citation_urls"]],
+            )
+        )
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        if self.format == "parquet" and self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._writer = None
+
+    def tokens_by_model(self) -> dict[str, dict[str, int]]:
+        """Request count and token sums per model, flushed rows only."""
+        return {
+            model: {
+                "requests": int(row[0]),
+                "prompt_tokens": int(row[1]),
+                "completion_tokens": int(row[2]),
+                "total_tokens": int(row[3]),
+            }
+            for model, row in self._model_totals.items()
+        }
+
+    def cost_by_model(self) -> dict[str, float]:
+        """Cost per model from the price table; unpriced models are NaN."""
+        costs = {}
+        for model, row in self._model_totals.items():
+            if (price := self.price_config.get(model)) is None:
+                costs[model] = math.nan
+                continue
+            costs[model] = float(
+                price["input_tokens"] * row[1]
+                + price["output_tokens"] * row[2]
+            )
+        return costs
+
+    @property
+    def unpriced_models(self) -> list[str]:
+        return [
+            model
+            for model in self._model_totals
+            if model not in self.price_config
+        ]
+
+    def citation_domain_histogram(
+        self, top: int | None = None
+    ) -> list[tuple[str, int]]:
+        """Citation counts per domain, most cited first."""
+        return self._domain_counts.most_common(top)
@@ -2,10 +2,21 @@ import json
 from collections.abc import AsyncGenerator
 from typing import Any
 
-import aiohttp
 from pydantic import BaseModel, ConfigDict, Field
 
 from .data_models import PerplexityEndpointRequestBody
+from .transport import AiohttpTransport, Transport, TransportResponse
+
+
+class PerplexityAPIError(Exception):
+    """Non-200 response from the Perplexity API."""
+
+    def __init__(
+        self, message: str, status: int, headers: dict[str, str] = None
+    ):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
 
 
 class PerplexityRequest(BaseModel):
@@ -18,16 +29,75 @@ class PerplexityRequest(BaseModel):
     method: str = Field(description="HTTP method")
     content_type: str | None = "application/json"
     base_url: str = "https://api.perplexity.ai"
+    transport: Transport = Field(
+        default_factory=AiohttpTransport,
+        description="Transport carrying requests to the API",
+        exclude=True,
+    )
 
     model_config = ConfigDict(
         arbitrary_types_allowed=True,
         extra="allow",  # Allow extra attributes for mocking in tests
     )
 
+    def _headers(self, content_type: str | None) -> dict[str, str]:
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if content_type:
+            headers["Content-Type"] = content_type
+        return headers
+
+    @staticmethod
+    def _error_message(body: bytes) -> str:
+        try:
+            error_body = json.loads(body)
+            return error_body.get("error", {}).get("message", str(error_body))
+        except Exception:
+            return body.decode("utf-8", errors="replace")
+
+    @classmethod
+    def _raise_for_status(cls, response: TransportResponse) -> None:
+        if response.status != 200:
+            raise PerplexityAPIError(
+                f"API request failed with status {response.status}: "
+                f"{cls._error_message(response.body)}",
+                status=response.status,
+                headers=response.headers,
+            )
+
+    async def _download(
+        self,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | dict[str, Any] | None,
+        output_file: str,
+    ) -> None:
+        """Write the response body to ``output_file`` as it arrives."""
+        async with self.transport.stream(
+            self.method, url, headers, data
+        ) as response:
+            self._raise_for_status(response)
+            with open(output_file, "wb") as f:
+                async for chunk in response.lines:
+                    f.write(chunk)
+
+    @staticmethod
+    def _serialize(
+        json_data: None | (
+            bytes | dict[str, Any] | PerplexityEndpointRequestBody
+        ),
+    ) -> bytes | None:
+        if json_data is None or isinstance(json_data, bytes):
+            return json_data
+        if isinstance(json_data, PerplexityEndpointRequestBody):
+            return json_data.model_dump_json(exclude_unset=True).encode(
+                "utf-8"
+            )
+        return json.dumps(json_data).encode("utf-8")
+
     async def invoke(
         self,
         json_data: None | (
-            dict[str, Any] | PerplexityEndpointRequestBody
+            bytes | dict[str, Any] | PerplexityEndpointRequestBody
         ) = None,
         form_data: BaseModel | None = None,
         output_file: str | None = None,
@@ -36,134 +106,103 @@ class PerplexityRequest(BaseModel):
     ) -> dict[str, Any] | tuple[dict[str, Any], dict[str, str]] | bytes | None:
         """Make a request to the Perplexity API."""
         url = f"{self.base_url}/{self.endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-        }
 
-        if self.content_type:
-            headers["Content-Type"] = self.content_type
-
-        if isinstance(json_data, PerplexityEndpointRequestBody):
-            json_data = json_data.model_dump(exclude_unset=True)
-
-        async with aiohttp.ClientSession() as client:
-            response = await client.request(
-                method=self.method,
-                url=url,
-                headers=headers,
-                json=json_data,
-                data=form_data.model_dump() if form_data else None,
+        if form_data is not None:
+            headers = self._headers(self.content_type)
+            data = form_data.model_dump()
+        else:
+            # a JSON body is always labelled, as aiohttp's ``json=`` did
+            headers = self._headers(
+                self.content_type
+                or ("application/json" if json_data is not None else None)
             )
-            async with response:
-                if response.status != 200:
-                    try:
-                        error_body = await response.json()
-                        error_msg = error_body.get("error", {}).get(
-                            "message", str(error_body)
-                        )
-                    except Exception:
-                        error_msg = await response.text()
-                    raise Exception(
-                        f"API request failed with status {response.status}: {error_msg}"
-                    )
-
-                if output_file:
-                    with open(output_file, "wb") as f:
-                        async for chunk in response.content.iter_chunked(8192):
-                            f.write(chunk)
-                    return None
-
-                if parse_response:
-                    response_body = await response.json()
-                else:
-                    response_body = await response.text()
-                    try:
-                        response_body = json.loads(response_body)
-                    except json.JSONDecodeError:
-                        pass
-
-                if with_response_header:
-                    headers = {
-                        k.lower(): v for k, v in response.headers.items()
-                    }
-                    return response_body, headers
-                return response_body
+            data = self._serialize(json_data)
+
+        if output_file:
+            await self._download(url, headers, data, output_file)
+            return None
+
+        response = await self.transport.request(
+            self.method, url, headers, data
+        )
+        self._raise_for_status(response)
+
+        if parse_response:
+            response_body = json.loads(response.body)
+        else:
+            response_body = response.body.decode("utf-8")
+            try:
+                response_body = json.loads(response_body)
+            except json.JSONDecodeError:
+                pass
+
+        if with_response_header:
+            return response_body, response.headers
+        return response_body
 
     async def stream(
         self,
         json_data: None | (
-            dict[str, Any] | PerplexityEndpointRequestBody
+            bytes | dict[str, Any] | PerplexityEndpointRequestBody
         ) = None,
         output_file: str | None = None,
         with_response_header: bool = False,
         verbose: bool = True,
     ) -> AsyncGenerator[dict[str, Any], None]:
-        """Stream responses from the Perplexity API."""
+        """Stream responses from the Perplexity API.
+
+        Pre-serialized ``bytes`` bodies are sent as-is and must already
+        carry ``"stream": true``.
+        """
         if isinstance(json_data, PerplexityEndpointRequestBody):
             json_data = json_data.model_dump(exclude_unset=True)
 
-        if not json_data.get("stream", False):
+        if not isinstance(json_data, bytes) and not json_data.get(
+            "stream", False
+        ):
             json_data["stream"] = True
 
         url = f"{self.base_url}/{self.endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.api_key}",
-            "Content-Type": "application/json",
-            "Accept": "text/event-stream",
-        }
-
-        async with aiohttp.ClientSession() as client:
-            response = await client.post(url, headers=headers, json=json_data)
-            async with response:
-                if response.status != 200:
-                    try:
-                        error_body = await response.json()
-                        error_msg = error_body.get("error", {}).get(
-                            "message", str(error_body)
-                        )
-                    except Exception:
-                        error_msg = await response.text()
-                    raise Exception(
-                        f"API request failed with status {response.status}: {error_msg}"
-                    )
+        headers = self._headers("application/json")
+        headers["Accept"] = "text/event-stream"
+
+        async with self.transport.stream(
+            "POST", url, headers, self._serialize(json_data)
+        ) as response:
+            self._raise_for_status(response)
 
-                if with_response_header:
-                    headers = {
-                        k.lower(): v for k, v in response.headers.items()
-                    }
-                    yield {"headers": headers}
-
-                file_handle = None
-                if output_file:
-                    try:
-                        file_handle = open(output_file, "w")
-                    except Exception as e:
-                        raise ValueError(
-                            f"Failed to open output file {output_file}: {e}"
-                        )
+            if with_response_header:
+                yield {"headers": response.headers}
 
+            file_handle = None
+            if output_file:
                 try:
-                    async for chunk in response.content:
-                        if chunk:
-                            chunk_str = chunk.decode("utf-8").strip()
-                            if chunk_str.startswith("data: "):
-                                chunk_str = chunk_str[
-                                    6:
-                                ]  # Remove "data: " prefix
-                            try:
-                                chunk_data = json.loads(chunk_str)
-                                if file_handle:
-                                    file_handle.write(
-                                        json.dumps(chunk_data) + "\n"
-                                    )
-                                if verbose and "choices" in chunk_data:
-                                    content = chunk_data["choices"][0][
-                                        "delta"
-                                    ]["content"]
-                                    print(content, end="", flush=True)
-                                yield chunk_data
-                            except json.JSONDecodeError:
-                                continue
-                finally:
-                    if file_handle:
-                        file_handle.close()
+                    file_handle = open(output_file, "w")
+                except Exception as e:
+                    raise ValueError(
+                        f"Failed to open output file {output_file}: {e}"
+                    )
+
+            try:
+                async for chunk in response.lines:
+                    if chunk:
+                        chunk_str = chunk.decode("utf-8").strip()
+                        if chunk_str.startswith("data: "):
+                            chunk_str = chunk_str[6:]  # Remove "data: " prefix
+                        try:
+                            chunk_data = json.loads(chunk_str)
+                            if file_handle:
+                                file_handle.write(
+                                    json.dumps(chunk_data) + "\n"
+                                )
+                            if verbose and "choices" in chunk_data:
+                                content = chunk_data["choices"][0]["delta"][
+                                    "content"
+                                ]
+                                print(content, end="", flush=True)
+                            yield chunk_data
+                        except json.JSONDecodeError:
+                            continue
+            finally:
+                if file_handle:
+                    file_handle.close()
@@ -0,0 +1,269 @@
+import json
+import sys
+from array import array
+from dataclasses import dataclass
+from typing import Any
+
+from lion_perplexity.api_endpoints.data_models import Citation, Usage
+
+from .response_body import (
+    Choice,
+    Message,
+    PerplexityChatCompletionResponseBody,
+    RelatedQuestion,
+)
+
+# citation kinds stored in ``CitationTable.kinds``
+URL_CITATION = 0  # {"url": ...} dict, the shape string citations become
+MODEL_CITATION = 1  # ``Citation`` model, entry is a field tuple
+DICT_CITATION = 2  # any other dict, entry is its JSON encoding
+STR_CITATION = 3  # bare string left in place
+
+_CITATION_FIELDS = tuple(Citation.model_fields)
+
+
+class CitationTable:
+    """Interning table shared by compact responses.
+
+    Every distinct citation is stored once; responses keep an
+    ``array("I")`` of ids into the table, i.e. 4 bytes per citation.
+
+    A table only grows and lives as long as the responses referring to
+    it, so scope one to a batch or a sink rather than the process. It is
+    not thread-safe; give each thread its own table.
+    """
+
+    __slots__ = ("entries", "kinds", "_ids")
+
+    def __init__(self):
+        self.entries: list[str | tuple] = []
+        self.kinds = bytearray()
+        self._ids: dict[tuple[int, str | tuple], int] = {}
+
+    def __len__(self):
+        return len(self.entries)
+
+    def intern(self, kind: int, entry: str | tuple) -> int:
+        key = (kind, entry)
+        if (citation_id := self._ids.get(key)) is None:
+            citation_id = len(self.entries)
+            if kind == URL_CITATION or kind == STR_CITATION:
+                entry = sys.intern(entry)
+            self.entries.append(entry)
+            self.kinds.append(kind)
+            self._ids[key] = citation_id
+        return citation_id
+
+    def intern_citation(self, citation: Citation | dict | str) -> int:
+        if isinstance(citation, Citation):
+            return self.intern(
+                MODEL_CITATION,
+                tuple(getattr(citation, f) for f in _CITATION_FIELDS),
+            )
+        if isinstance(citation, dict):
+            if len(citation) == 1 and isinstance(citation.get("url"), str):
+                return self.intern(URL_CITATION, citation["url"])
+            return self.intern(
+                DICT_CITATION, json.dumps(citation, sort_keys=True)
+            )
+        return self.intern(STR_CITATION, citation)
+
+    def intern_raw(self, citation: Any) -> int:
+        """Intern a citation as it appears in a raw API response."""
+        if isinstance(citation, str):
+            return self.intern(URL_CITATION, citation)
+        if isinstance(citation, dict) and "url" in citation:
+            if len(citation) == 1:
+                return self.intern(URL_CITATION, citation["url"])
+            if citation.keys() <= Citation.model_fields.keys():
+                return self.intern(
+                    MODEL_CITATION,
+                    tuple(citation.get(f) for f in _CITATION_FIELDS),
+                )
+        return self.intern(DICT_CITATION, json.dumps(citation, sort_keys=True))
+
+    def url(self, citation_id: int) -> str | None:
+        kind, entry = self.kinds[citation_id], self.entries[citation_id]
+        if kind == URL_CITATION or kind == STR_CITATION:
+            return entry
+        if kind == MODEL_CITATION:
+            return entry[0]
+        return json.loads(entry).get("url")
+
+    def materialize(self, citation_id: int) -> Citation | dict | str:
+        kind, entry = self.kinds[citation_id], self.entries[citation_id]
+        if kind == URL_CITATION:
+            return {"url": entry}
+        if kind == MODEL_CITATION:
+            return Citation.model_construct(
+                **{
+                    f: v
+                    for f, v in zip(_CITATION_FIELDS, entry)
+                    if v is not None
+                }
+            )
+        if kind == DICT_CITATION:
+            return json.loads(entry)
+        return entry
+
+
+@dataclass(slots=True)
+class CompactChoice:
+    """Slot-based counterpart of ``Choice``; the role is always assistant."""
+
+    index: int
+    content: str
+    finish_reason: str | None
+    extra: dict[str, Any] | None = None
+
+
+@dataclass(slots=True)
+class CompactChatCompletion:
+    """Low-overhead, lossless form of ``PerplexityChatCompletionResponseBody``.
+
+    Usage is flattened into three ints, the constant ``object`` field is
+    dropped, related questions become a tuple of strings and citations an
+    ``array("I")`` of ids into a shared ``CitationTable``.
+    """
+
+    id: str
+    model: str
+    created: int
+    choices: tuple[CompactChoice, ...]
+    prompt_tokens: int
+    completion_tokens: int
+    total_tokens: int
+    citations: array | None
+    related_questions: tuple[str, ...] | None
+    table: CitationTable
+
+    @classmethod
+    def from_model(
+        cls,
+        body: PerplexityChatCompletionResponseBody,
+        table: CitationTable,
+    ) -> "CompactChatCompletion":
+        return cls(
+            id=body.id,
+            model=sys.intern(body.model),
+            created=body.created,
+            choices=tuple(
+                CompactChoice(
+                    c.index,
+                    c.message.content,
+                    c.finish_reason,
+                    c.model_extra or None,
+                )
+                for c in body.choices
+            ),
+            prompt_tokens=body.usage.prompt_tokens,
+            completion_tokens=body.usage.completion_tokens,
+            total_tokens=body.usage.total_tokens,
+            citations=(
+                None
+                if body.citations is None
+                else array(
+                    "I", [table.intern_citation(c) for c in body.citations]
+                )
+            ),
+            related_questions=(
+                None
+                if body.related_questions is None
+                else tuple(q.text for q in body.related_questions)
+            ),
+            table=table,
+        )
+
+    @classmethod
+    def from_response(
+        cls, response: dict[str, Any], table: CitationTable
+    ) -> "CompactChatCompletion":
+        """Build directly from a raw API response without validation.
+
+        Intended for trusted payloads; use ``from_model`` when the
+        response should go through the Pydantic validators first.
+        """
+        usage = response["usage"]
+        citations = response.get("citations")
+        related_questions = response.get("related_questions")
+
+        choices = []
+        for c in response["choices"]:
+            extra = {
+                k: v
+                for k, v in c.items()
+                if k not in ("index", "message", "finish_reason")
+            }
+            choices.append(
+                CompactChoice(
+                    c["index"],
+                    c["message"]["content"],
+                    c.get("finish_reason"),
+                    extra or None,
+                )
+            )
+
+        return cls(
+            id=response["id"],
+            model=sys.intern(response["model"]),
+            created=response["created"],
+            choices=tuple(choices),
+            prompt_tokens=usage["prompt_tokens"],
+            completion_tokens=usage["completion_tokens"],
+            total_tokens=usage["total_tokens"],
+            citations=(
+                None
+                if citations is None
+                else array("I", [table.intern_raw(c) for c in citations])
+            ),
+            related_questions=(
+                None
+                if related_questions is None
+                else tuple(q["text"] for q in related_questions)
+            ),
+            table=table,
+        )
+
+    @property
+    def citation_urls(self) -> list[str | None]:
+        if self.citations is None:
+            return []
+        return [self.table.url(i) for i in self.citations]
+
+    def to_model(self) -> PerplexityChatCompletionResponseBody:
+        """Rebuild the Pydantic model without re-running validators."""
+        return PerplexityChatCompletionResponseBody.model_construct(
+            id=self.id,
+            model=self.model,
+            object="chat.completion",
+            created=self.created,
+            choices=[
+                Choice.model_construct(
+                    index=c.index,
+                    message=Message.model_construct(
+                        role="assistant", content=c.content
+                    ),
+                    finish_reason=c.finish_reason,
+                    **(c.extra or {}),
+                )
+                for c in self.choices
+            ],
+            usage=Usage.model_construct(
+                prompt_tokens=self.prompt_tokens,
+                completion_tokens=self.completion_tokens,
+                total_tokens=self.total_tokens,
+            ),
+            citations=(
+                None
+                if self.citations is None
+                else [self.table.materialize(i) for i in self.citations]
+            ),
+            related_questions=(
+                None
+                if self.related_questions is None
+                else [
+                    RelatedQuestion.model_construct(text=text)
+                    for text in self.related_questions
+                ]
+            ),
+        )
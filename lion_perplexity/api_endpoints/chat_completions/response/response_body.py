@@ -1,4 +1,12 @@
-from pydantic import BaseModel, ConfigDict, Field, field_validator
+from typing import ClassVar
+
+from pydantic import (
+    BaseModel,
+    ConfigDict,
+    Field,
+    ValidationInfo,
+    field_validator,
+)
 
 from lion_perplexity.api_endpoints.data_models import (
     Citation,
@@ -74,7 +82,15 @@ class RelatedQuestion(BaseModel):
 
 
 class PerplexityChatCompletionResponseBody(PerplexityEndpointResponseBody):
-    """Response body for chat completion requests."""
+    """Response body for chat completion requests.
+
+    ``max_citations`` caps the number of citations accepted (``None`` for
+    no cap). It can be overridden per subclass or per call through the
+    validation context, e.g.
+    ``model_validate(data, context={"max_citations": 50})``.
+    """
+
+    max_citations: ClassVar[int | None] = None
 
     id: str = Field(description="A unique identifier for this completion.")
     model: str = Field(description="The model used for completion.")
@@ -117,19 +133,20 @@ class PerplexityChatCompletionResponseBody(PerplexityEndpointResponseBody):
     @field_validator("citations")
     @classmethod
     def validate_citations(
-        cls, citations: list[Citation | dict | str] | None
+        cls,
+        citations: list[Citation | dict | str] | None,
+        info: ValidationInfo,
     ) -> list[Citation | dict | str] | None:
         if citations is not None:
-            if len(citations) > 10:  # Arbitrary limit for safety
-                raise ValueError("Too many citations")
+            max_citations = (info.context or {}).get(
+                "max_citations", cls.max_citations
+            )
+            if max_citations is not None and len(citations) > max_citations:
+                raise ValueError(
+                    f"Too many citations ({len(citations)} > {max_citations})"
+                )
             # Convert string citations to Citation objects
-            processed_citations = []
-            for citation in citations:
-                if isinstance(citation, str):
-                    processed_citations.append({"url": citation})
-                else:
-                    processed_citations.append(citation)
-            return processed_citations
+            return [{"url": c} if isinstance(c, str) else c for c in citations]
         return citations
 
     @field_validator("related_questions")
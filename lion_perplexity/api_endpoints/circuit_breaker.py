@@ -0,0 +1,159 @@
+import time
+from collections import deque
+from enum import Enum
+from typing import Any, NamedTuple
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+
+class CircuitState(str, Enum):
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+
+class CircuitTicket(NamedTuple):
+    """Admission returned by ``CircuitBreaker.allow``."""
+
+    state: CircuitState
+    generation: int
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open."""
+
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+class CircuitBreaker(BaseModel):
+    """Fail-fast guard for one (base_url, endpoint, model) upstream.
+
+    Outcomes are kept in a sliding time window. Once the window holds at
+    least ``minimum_calls`` and the share of failures (errors or calls
+    slower than ``slow_call_threshold``) reaches
+    ``failure_rate_threshold`` the circuit opens and calls are rejected
+    with ``CircuitOpenError`` for ``open_duration`` seconds. It then
+    turns half-open and lets up to ``half_open_max_calls`` probes
+    through: if they all succeed the circuit closes, any failure opens
+    it again.
+
+    ``allow`` returns a ticket that the caller hands back to ``record``
+    or ``release``. Every state change starts a new generation, and
+    outcomes of calls admitted in an earlier one are ignored, so a slow
+    call admitted while closed cannot settle a half-open probe.
+    """
+
+    failure_rate_threshold: float = Field(default=0.5, gt=0, le=1)
+    slow_call_threshold: float = Field(
+        default=30, gt=0, description="Seconds after which a call is slow"
+    )
+    window: float = Field(default=30, gt=0, description="Window in seconds")
+    minimum_calls: int = Field(default=10, ge=1)
+    open_duration: float = Field(default=30, ge=0)
+    half_open_max_calls: int = Field(default=1, ge=1)
+
+    state: CircuitState = CircuitState.CLOSED
+    rejected: int = Field(default=0, description="Calls failed fast")
+
+    _outcomes: deque = PrivateAttr(default_factory=deque)
+    _failures: int = PrivateAttr(default=0)
+    _opened_at: float = PrivateAttr(default=0.0)
+    _probes_in_flight: int = PrivateAttr(default=0)
+    _probe_successes: int = PrivateAttr(default=0)
+    _generation: int = PrivateAttr(default=0)
+
+    def _prune(self, now: float) -> None:
+        outcomes = self._outcomes
+        while outcomes and now - outcomes[0][0] > self.window:
+            _, failed = outcomes.popleft()
+            self._failures -= failed
+
+    def _open(self, now: float) -> None:
+        self.state = CircuitState.OPEN
+        self._generation += 1
+        self._opened_at = now
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+
+    def _close(self) -> None:
+        self.state = CircuitState.CLOSED
+        self._generation += 1
+        self._outcomes.clear()
+        self._failures = 0
+
+    def allow(self) -> CircuitTicket:
+        """Admit a call or raise ``CircuitOpenError``."""
+        if self.state is CircuitState.CLOSED:
+            return CircuitTicket(self.state, self._generation)
+
+        now = time.monotonic()
+        if self.state is CircuitState.OPEN:
+            remaining = self._opened_at + self.open_duration - now
+            if remaining > 0:
+                self.rejected += 1
+                raise CircuitOpenError(
+                    f"Circuit open, retry in {remaining:.1f}s", remaining
+                )
+            self.state = CircuitState.HALF_OPEN
+
+        if self._probes_in_flight >= self.half_open_max_calls:
+            self.rejected += 1
+            raise CircuitOpenError("Circuit half-open, probe in flight", 0.0)
+        self._probes_in_flight += 1
+        return CircuitTicket(self.state, self._generation)
+
+    def record(
+        self, ticket: CircuitTicket, failed: bool, latency: float = 0.0
+    ) -> None:
+        """Report the outcome of the call admitted with ``ticket``."""
+        if ticket.generation != self._generation:
+            # late result of a call admitted before the last state change
+            return
+        failed = failed or latency > self.slow_call_threshold
+        now = time.monotonic()
+
+        if ticket.state is CircuitState.HALF_OPEN:
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+            if failed:
+                self._open(now)
+                return
+            self._probe_successes += 1
+            if self._probe_successes >= self.half_open_max_calls:
+                self._close()
+            return
+
+        self._outcomes.append((now, failed))
+        self._failures += failed
+        self._prune(now)
+        calls = len(self._outcomes)
+        if (
+            calls >= self.minimum_calls
+            and self._failures / calls >= self.failure_rate_threshold
+        ):
+            self._open(now)
+
+    def release(self, ticket: CircuitTicket) -> None:
+        """Forget an admitted call that ended without an outcome."""
+        if (
+            ticket.generation == self._generation
+            and ticket.state is CircuitState.HALF_OPEN
+        ):
+            self._probes_in_flight = max(0, self._probes_in_flight - 1)
+
+    def health(self) -> dict[str, Any]:
+        now = time.monotonic()
+        self._prune(now)
+        calls = len(self._outcomes)
+        return {
+            "state": self.state.value,
+            "calls": calls,
+            "failure_rate": self._failures / calls if calls else 0.0,
+            "rejected": self.rejected,
+            "retry_after": (
+                max(0.0, self._opened_at + self.open_duration - now)
+                if self.state is CircuitState.OPEN
+                else 0.0
+            ),
+        }
@@ -0,0 +1,148 @@
+import asyncio
+import copy
+import hashlib
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .data_models import PerplexityEndpointRequestBody
+
+
+class CoalescerStats(BaseModel):
+    """How much upstream work in-flight coalescing saved."""
+
+    requests: int = Field(default=0, description="Calls seen")
+    upstream_calls: int = Field(default=0, description="Calls sent upstream")
+    coalesced: int = Field(
+        default=0, description="Calls served by another call in flight"
+    )
+    saved_tokens: int = Field(
+        default=0, description="Tokens of usage shared instead of spent"
+    )
+
+    @property
+    def saved_ratio(self) -> float:
+        return self.coalesced / self.requests if self.requests else 0.0
+
+
+class _StreamFlight:
+    __slots__ = ("chunks", "done", "error", "changed", "task")
+
+    def __init__(self):
+        self.task: asyncio.Task | None = None
+        self.chunks: list[dict[str, Any]] = []
+        self.done = False
+        self.error: BaseException | None = None
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+
+def _usage_tokens(response: Any) -> int:
+    if isinstance(response, dict) and isinstance(
+        usage := response.get("usage"), dict
+    ):
+        return usage.get("total_tokens") or 0
+    return 0
+
+
+class RequestCoalescer(BaseModel):
+    """Share one upstream call among concurrent identical requests.
+
+    Requests are keyed by a hash of their serialized body. The first
+    caller for a key runs the call (including rate limit admission and
+    usage accounting); callers arriving while it is in flight await the
+    same result instead of issuing their own. For streams, a late joiner
+    first gets every chunk received so far, then the live tail.
+
+    The shared call runs in its own task so a cancelled caller does not
+    cancel it for the others. Callers of a shared call or stream each
+    get their own deep copy of the results, so they cannot see each
+    other's mutations.
+    """
+
+    stats: CoalescerStats = Field(default_factory=CoalescerStats)
+
+    # key: [task, number of joiners]
+    _calls: dict[bytes, list] = PrivateAttr(default_factory=dict)
+    _streams: dict[bytes, _StreamFlight] = PrivateAttr(default_factory=dict)
+
+    @staticmethod
+    def key(request_body: PerplexityEndpointRequestBody | bytes) -> bytes:
+        if isinstance(request_body, PerplexityEndpointRequestBody):
+            request_body = request_body.model_dump_json(
+                exclude_unset=True
+            ).encode("utf-8")
+        return hashlib.blake2b(request_body, digest_size=16).digest()
+
+    async def run(
+        self, key: bytes, call: Callable[[], Awaitable[Any]]
+    ) -> tuple[Any, bool]:
+        """Return ``(result, shared)``; ``shared`` is True for joiners."""
+        self.stats.requests += 1
+        if (flight := self._calls.get(key)) is not None:
+            self.stats.coalesced += 1
+            flight[1] += 1
+            result = await asyncio.shield(flight[0])
+            self.stats.saved_tokens += _usage_tokens(result)
+            return copy.deepcopy(result), True
+
+        self.stats.upstream_calls += 1
+        task = asyncio.ensure_future(call())
+        flight = self._calls[key] = [task, 0]
+        task.add_done_callback(lambda _: self._calls.pop(key, None))
+        result = await asyncio.shield(task)
+        # joiners can only arrive while the task runs, so this is final
+        return (copy.deepcopy(result) if flight[1] else result), False
+
+    async def stream(
+        self,
+        key: bytes,
+        open_stream: Callable[[], AsyncIterator[dict[str, Any]]],
+    ) -> AsyncIterator[dict[str, Any]]:
+        self.stats.requests += 1
+        flight = self._streams.get(key)
+        shared = flight is not None
+        if shared:
+            self.stats.coalesced += 1
+        else:
+            self.stats.upstream_calls += 1
+            flight = _StreamFlight()
+            self._streams[key] = flight
+            flight.task = asyncio.ensure_future(
+                self._pump(key, flight, open_stream)
+            )
+
+        position = 0
+        while True:
+            while position < len(flight.chunks):
+                yield copy.deepcopy(flight.chunks[position])
+                position += 1
+            if flight.done:
+                break
+            await flight.changed.wait()
+
+        if flight.error is not None:
+            raise flight.error
+        if shared and flight.chunks:
+            self.stats.saved_tokens += _usage_tokens(flight.chunks[-1])
+
+    async def _pump(
+        self,
+        key: bytes,
+        flight: _StreamFlight,
+        open_stream: Callable[[], AsyncIterator[dict[str, Any]]],
+    ) -> None:
+        try:
+            async for chunk in open_stream():
+                flight.chunks.append(chunk)
+                flight.notify()
+        except Exception as e:
+            flight.error = e
+        finally:
+            flight.done = True
+            self._streams.pop(key, None)
+            flight.notify()
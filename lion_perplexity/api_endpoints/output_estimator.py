@@ -0,0 +1,162 @@
+import math
+from typing import Any
+
+from pydantic import BaseModel, Field, PrivateAttr
+
+_GROWTH = math.log(1.1)  # bin width: upper edges ~10% apart
+
+
+class _LogHistogram:
+    """Counts of non-negative integers in log-spaced bins."""
+
+    __slots__ = ("counts", "total")
+
+    def __init__(self):
+        self.counts: list[float] = []
+        self.total = 0.0
+
+    def add(self, value: int) -> None:
+        index = int(math.log1p(value) / _GROWTH)
+        if index >= len(self.counts):
+            self.counts.extend([0.0] * (index + 1 - len(self.counts)))
+        self.counts[index] += 1
+        self.total += 1
+
+    def halve(self) -> None:
+        self.counts = [count / 2 for count in self.counts]
+        self.total /= 2
+
+    def quantile(self, q: float) -> int:
+        """Upper edge of the bin holding the ``q`` quantile."""
+        target = q * self.total
+        cumulative = 0.0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                break
+        return math.ceil(math.expm1((index + 1) * _GROWTH))
+
+
+class EstimatorStats(BaseModel):
+    """Reserved output tokens reconciled against actual usage."""
+
+    observations: int = Field(default=0)
+    reserved_tokens: int = Field(default=0)
+    used_tokens: int = Field(default=0)
+    over_reserved_tokens: int = Field(
+        default=0, description="Reserved but not used"
+    )
+    under_reserved_tokens: int = Field(
+        default=0, description="Used beyond the reservation"
+    )
+    under_reserved: int = Field(
+        default=0, description="Calls that used more than reserved"
+    )
+
+    @property
+    def under_reserved_ratio(self) -> float:
+        if not self.observations:
+            return 0.0
+        return self.under_reserved / self.observations
+
+
+class OutputLengthEstimator(BaseModel):
+    """Learn completion lengths to size output token reservations.
+
+    Observed ``usage.completion_tokens`` go into a log-spaced histogram
+    per prompt-length bucket (powers of two of the input token count)
+    and into one for all prompts. ``estimate`` returns the ``quantile``
+    of the most specific histogram with at least ``min_samples``
+    observations, or None while there is not enough data so the caller
+    can fall back to its static reservation. Once a histogram holds
+    ``max_samples`` its counts are halved, so older traffic fades out.
+
+    Completions cut off by ``max_tokens`` are not learned from, as their
+    true length is unknown.
+
+    The rate limiter only learns a call's usage once it completes, so
+    admitted calls ``hold`` their input and reserved output tokens in
+    ``in_flight_tokens`` until ``reconcile`` swaps the reservation for
+    the observed usage.
+    """
+
+    quantile: float = Field(default=0.9, gt=0, lt=1)
+    min_samples: int = Field(default=30, ge=1)
+    max_samples: int = Field(default=5000, ge=2)
+    by_prompt_length: bool = Field(
+        default=True, description="Keep a histogram per prompt length"
+    )
+    stats: EstimatorStats = Field(default_factory=EstimatorStats)
+    in_flight_tokens: int = Field(
+        default=0, description="Held by calls not yet reconciled"
+    )
+
+    _histograms: dict[int | None, _LogHistogram] = PrivateAttr(
+        default_factory=dict
+    )
+
+    def _buckets(self, input_tokens_len: int) -> tuple[int | None, ...]:
+        if self.by_prompt_length:
+            return (input_tokens_len.bit_length(), None)
+        return (None,)
+
+    def estimate(self, input_tokens_len: int = 0) -> int | None:
+        for bucket in self._buckets(input_tokens_len):
+            histogram = self._histograms.get(bucket)
+            if histogram is not None and histogram.total >= self.min_samples:
+                return histogram.quantile(self.quantile)
+        return None
+
+    def observe(
+        self,
+        input_tokens_len: int,
+        completion_tokens: int,
+        reserved: int = 0,
+        truncated: bool = False,
+    ) -> None:
+        """Record a finished call's output length against its reservation."""
+        stats = self.stats
+        stats.observations += 1
+        stats.reserved_tokens += reserved
+        stats.used_tokens += completion_tokens
+        if completion_tokens > reserved:
+            stats.under_reserved += 1
+            stats.under_reserved_tokens += completion_tokens - reserved
+        else:
+            stats.over_reserved_tokens += reserved - completion_tokens
+
+        if truncated:
+            return
+        for bucket in self._buckets(input_tokens_len):
+            histogram = self._histograms.get(bucket)
+            if histogram is None:
+                histogram = self._histograms[bucket] = _LogHistogram()
+            histogram.add(completion_tokens)
+            if histogram.total >= self.max_samples:
+                histogram.halve()
+
+    def hold(self, input_tokens_len: int, reserved: int) -> None:
+        self.in_flight_tokens += input_tokens_len + reserved
+
+    def reconcile(
+        self, input_tokens_len: int, reserved: int, response: Any = None
+    ) -> None:
+        """Release a ``hold`` and ``observe`` the call's response.
+
+        ``response`` is a raw response body or final stream chunk; failed
+        calls pass None and are only released.
+        """
+        self.in_flight_tokens -= input_tokens_len + reserved
+        if not isinstance(response, dict) or not isinstance(
+            usage := response.get("usage"), dict
+        ):
+            return
+        if (completion_tokens := usage.get("completion_tokens")) is None:
+            return
+        choices = response.get("choices") or [{}]
+        self.observe(
+            input_tokens_len,
+            completion_tokens,
+            reserved=reserved,
+            truncated=choices[0].get("finish_reason") == "length",
+        )
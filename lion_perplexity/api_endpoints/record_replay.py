@@ -0,0 +1,416 @@
+import asyncio
+import hashlib
+import json
+import mmap
+import os
+import struct
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any
+
+from pydantic import ConfigDict, Field, PrivateAttr
+
+from .transport import Transport, TransportResponse
+
+ARCHIVE_MAGIC = b"LPXTRAF1"
+
+# key digest, meta length, body length
+_RECORD_HEADER = struct.Struct("<16sII")
+
+
+def request_key(
+    method: str, url: str, data: bytes | dict[str, Any] | None
+) -> bytes:
+    """Hash a request into the 16-byte key used to match recordings.
+
+    JSON bodies are canonicalized (sorted keys, compact separators) so
+    that semantically identical requests match regardless of key order.
+    The ``Authorization`` header never takes part in the key.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        try:
+            data = json.loads(data)
+        except (ValueError, UnicodeDecodeError):
+            body = bytes(data)
+        else:
+            body = None
+    else:
+        body = None
+    if body is None:
+        body = json.dumps(data, sort_keys=True, separators=(",", ":")).encode(
+            "utf-8"
+        )
+
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(method.upper().encode("ascii"))
+    digest.update(b"\x00")
+    digest.update(url.encode("utf-8"))
+    digest.update(b"\x00")
+    digest.update(body)
+    return digest.digest()
+
+
+class ArchivedResponse:
+    """A decoded archive record."""
+
+    __slots__ = ("status", "headers", "body", "elapsed", "lines", "delays")
+
+    def __init__(
+        self,
+        status: int,
+        headers: dict[str, str],
+        body: bytes,
+        elapsed: float,
+        lines: list[bytes] | None = None,
+        delays: list[float] | None = None,
+    ):
+        self.status = status
+        self.headers = headers
+        self.body = body
+        self.elapsed = elapsed
+        self.lines = lines
+        self.delays = delays
+
+
+class TrafficArchive:
+    """Append-only archive of request/response pairs.
+
+    The file starts with ``ARCHIVE_MAGIC`` followed by records of a fixed
+    header (request key, meta length, body length), a JSON meta block
+    (status, headers, timings) and a zlib-compressed body. For streaming
+    responses the body holds the raw SSE lines back to back and the meta
+    block holds their sizes and inter-line delays.
+
+    Opening an archive scans the record headers once to build an
+    in-memory ``key -> offsets`` index, which ``append`` keeps up to
+    date. Record payloads are decoded on access; the ``cache_size`` most
+    recently read records are kept decoded. By default that is every
+    record present when the archive was opened, and at least 128.
+    """
+
+    def __init__(
+        self,
+        path: str | os.PathLike,
+        mode: str = "r",
+        cache_size: int | None = None,
+    ):
+        if mode not in ("r", "a", "w"):
+            raise ValueError("Archive mode must be one of 'r', 'a', 'w'")
+
+        self.path = os.fspath(path)
+        self.mode = mode
+        self.cache_size = cache_size
+        self.index: dict[bytes, list[int]] = {}
+        self._cache: OrderedDict[int, ArchivedResponse] = OrderedDict()
+        self._file = None
+        self._map = None
+        self._end = len(ARCHIVE_MAGIC)
+        if cache_size is None:
+            self.cache_size = 128
+
+        if mode == "w" or (
+            mode == "a"
+            and (
+                not os.path.exists(self.path)
+                or os.path.getsize(self.path) == 0
+            )
+        ):
+            self._file = open(self.path, "wb")
+            self._file.write(ARCHIVE_MAGIC)
+            self._file.flush()
+            return
+
+        self._scan()
+        if cache_size is None:
+            self.cache_size = max(len(self), 128)
+        if mode == "a":
+            self._file = open(self.path, "r+b")
+            if os.path.getsize(self.path) > self._end:
+                # drop a truncated tail so new records stay reachable
+                if self._map is not None:
+                    self._map.close()
+                    self._map = None
+                self._file.truncate(self._end)
+            self._file.seek(self._end)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return sum(len(offsets) for offsets in self.index.values())
+
+    def __contains__(self, key: bytes):
+        return key in self.index
+
+    def _remap(self):
+        if self._map is not None:
+            self._map.close()
+        with open(self.path, "rb") as file:
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _scan(self):
+        with open(self.path, "rb") as file:
+            if file.read(len(ARCHIVE_MAGIC)) != ARCHIVE_MAGIC:
+                raise ValueError(f"{self.path} is not a traffic archive")
+        if os.path.getsize(self.path) == len(ARCHIVE_MAGIC):
+            return
+        self._remap()
+
+        offset = len(ARCHIVE_MAGIC)
+        end = len(self._map)
+        while offset + _RECORD_HEADER.size <= end:
+            key, meta_len, body_len = _RECORD_HEADER.unpack_from(
+                self._map, offset
+            )
+            record_end = offset + _RECORD_HEADER.size + meta_len + body_len
+            if record_end > end:
+                # truncated tail from an interrupted recording
+                break
+            self.index.setdefault(key, []).append(offset)
+            offset = record_end
+        self._end = offset
+
+    def append(
+        self,
+        key: bytes,
+        status: int,
+        headers: dict[str, str],
+        body: bytes = b"",
+        elapsed: float = 0.0,
+        lines: list[bytes] | None = None,
+        delays: list[float] | None = None,
+    ) -> None:
+        if self._file is None:
+            raise ValueError("Archive is not open for writing")
+
+        meta = {"status": status, "headers": headers, "elapsed": elapsed}
+        if lines is not None:
+            meta["sizes"] = [len(line) for line in lines]
+            meta["delays"] = delays or [0.0] * len(lines)
+            body = b"".join(lines)
+
+        compressed = zlib.compress(body)
+        if len(compressed) < len(body):
+            meta["z"] = 1
+            body = compressed
+
+        meta_bytes = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+        self._file.write(_RECORD_HEADER.pack(key, len(meta_bytes), len(body)))
+        self._file.write(meta_bytes)
+        self._file.write(body)
+        self._file.flush()
+        self.index.setdefault(key, []).append(self._end)
+        self._end += _RECORD_HEADER.size + len(meta_bytes) + len(body)
+
+    def read(self, offset: int) -> ArchivedResponse:
+        if (cached := self._cache.get(offset)) is not None:
+            self._cache.move_to_end(offset)
+            return cached
+
+        if self._map is None or offset >= len(self._map):
+            # written by append after the file was mapped
+            self._remap()
+        _, meta_len, body_len = _RECORD_HEADER.unpack_from(self._map, offset)
+        start = offset + _RECORD_HEADER.size
+        meta = json.loads(self._map[start : start + meta_len])
+        body = self._map[start + meta_len : start + meta_len + body_len]
+        if meta.get("z"):
+            body = zlib.decompress(body)
+
+        lines = None
+        if (sizes := meta.get("sizes")) is not None:
+            lines, position = [], 0
+            for size in sizes:
+                lines.append(body[position : position + size])
+                position += size
+            body = b""
+
+        record = ArchivedResponse(
+            status=meta["status"],
+            headers=meta["headers"],
+            body=body,
+            elapsed=meta.get("elapsed", 0.0),
+            lines=lines,
+            delays=meta.get("delays"),
+        )
+        if self.cache_size > 0:
+            self._cache[offset] = record
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return record
+
+    def close(self) -> None:
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+class RecordingTransport(Transport):
+    """Forward requests to ``transport`` and record every exchange."""
+
+    transport: Transport = Field(description="Transport doing the I/O")
+    archive: TrafficArchive = Field(description="Archive to append to")
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | dict[str, Any] | None = None,
+    ) -> TransportResponse:
+        start = time.monotonic()
+        response = await self.transport.request(method, url, headers, data)
+        self.archive.append(
+            request_key(method, url, data),
+            status=response.status,
+            headers=response.headers,
+            body=response.body,
+            elapsed=time.monotonic() - start,
+        )
+        return response
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | None = None,
+    ):
+        start = time.monotonic()
+        async with self.transport.stream(
+            method, url, headers, data
+        ) as response:
+            elapsed = time.monotonic() - start
+            lines, delays = [], []
+            complete = response.lines is None
+
+            async def tee(source):
+                nonlocal complete
+                last = time.monotonic()
+                async for line in source:
+                    now = time.monotonic()
+                    lines.append(bytes(line))
+                    delays.append(now - last)
+                    last = now
+                    yield line
+                complete = True
+
+            if response.lines is not None:
+                response.lines = tee(response.lines)
+            yield response
+
+        if not complete:
+            # abandoned by the consumer: not a faithful recording
+            return
+        self.archive.append(
+            request_key(method, url, data),
+            status=response.status,
+            headers=response.headers,
+            body=response.body,
+            elapsed=elapsed,
+            lines=lines,
+            delays=delays,
+        )
+
+    async def close(self) -> None:
+        await self.transport.close()
+
+
+class ReplayTransport(Transport):
+    """Serve responses from a ``TrafficArchive`` instead of the network.
+
+    Requests are matched by ``request_key``, which is memoized per raw
+    body so repeated requests skip canonicalization. When a key was
+    recorded several times the recordings are served round-robin. ``speed``
+    controls pacing: ``None`` replays as fast as possible, ``1.0`` at
+    the recorded latency and inter-line timing, ``2.0`` twice as fast.
+    """
+
+    archive: TrafficArchive = Field(description="Archive to serve from")
+    speed: float | None = Field(
+        default=None, description="Replay speed factor, None for no delay"
+    )
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    _cursors: dict[bytes, int] = PrivateAttr(default_factory=dict)
+    _keys: dict[tuple[str, str, bytes], bytes] = PrivateAttr(
+        default_factory=dict
+    )
+
+    def _key(self, method: str, url: str, data) -> bytes:
+        if not isinstance(data, bytes):
+            return request_key(method, url, data)
+        if (key := self._keys.get((method, url, data))) is None:
+            key = request_key(method, url, data)
+            # memoize hits only, so unmatched bodies do not grow it
+            if key in self.archive.index:
+                self._keys[method, url, data] = key
+        return key
+
+    def _lookup(self, method: str, url: str, data) -> ArchivedResponse:
+        key = self._key(method, url, data)
+        offsets = self.archive.index.get(key)
+        if not offsets:
+            raise ValueError(
+                f"No recorded response for {method} {url} "
+                f"(request key {key.hex()})"
+            )
+        cursor = self._cursors.get(key, 0)
+        self._cursors[key] = cursor + 1
+        return self.archive.read(offsets[cursor % len(offsets)])
+
+    async def _pace(self, seconds: float) -> None:
+        if self.speed and seconds > 0:
+            await asyncio.sleep(seconds / self.speed)
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | dict[str, Any] | None = None,
+    ) -> TransportResponse:
+        record = self._lookup(method, url, data)
+        await self._pace(record.elapsed)
+        return TransportResponse(
+            status=record.status,
+            headers=record.headers,
+            body=record.body,
+        )
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | None = None,
+    ):
+        record = self._lookup(method, url, data)
+        await self._pace(record.elapsed)
+
+        async def replay_lines():
+            lines = record.lines or []
+            delays = record.delays or [0.0] * len(lines)
+            for line, delay in zip(lines, delays):
+                await self._pace(delay)
+                yield line
+
+        yield TransportResponse(
+            status=record.status,
+            headers=record.headers,
+            body=record.body,
+            lines=replay_lines(),
+        )
@@ -0,0 +1,244 @@
+import asyncio
+import random
+import time
+from collections.abc import AsyncIterator, Awaitable, Callable
+from typing import Any, TypeVar
+
+import aiohttp
+from pydantic import BaseModel, Field, PrivateAttr
+
+from .api_request import PerplexityAPIError
+from .circuit_breaker import CircuitBreaker, CircuitTicket
+
+T = TypeVar("T")
+
+RETRYABLE_STATUS = frozenset({408, 409, 429})
+
+
+def is_retryable(error: BaseException) -> bool:
+    """Whether repeating the same request may succeed.
+
+    Server errors, throttling, timeouts and dropped connections are
+    retryable; other client errors, exhausted account quota and local
+    errors (validation, serialization) are not.
+    """
+    if isinstance(error, PerplexityAPIError):
+        if error.status == 429 and "exceeded your current quota" in str(error):
+            return False
+        return error.status in RETRYABLE_STATUS or error.status >= 500
+    return isinstance(
+        error,
+        (
+            aiohttp.ClientConnectionError,
+            aiohttp.ClientPayloadError,
+            asyncio.TimeoutError,
+            ConnectionError,
+        ),
+    )
+
+
+class StreamInterruptedError(Exception):
+    """A stream failed after some chunks were received.
+
+    ``chunks`` holds everything received before the failure so callers
+    can keep the partial answer.
+    """
+
+    def __init__(self, message: str, chunks: list[dict[str, Any]]):
+        super().__init__(message)
+        self.chunks = chunks
+
+
+class RetryPolicy(BaseModel):
+    """Backoff schedule for retryable errors."""
+
+    max_retries: int = Field(default=3, ge=0)
+    base_delay: float = Field(default=1, ge=0)
+    max_delay: float = Field(default=60, ge=0)
+    jitter: bool = Field(
+        default=True,
+        description="Full jitter: sleep uniformly in [0, backoff].",
+    )
+
+    def delay(self, retry: int, error: BaseException | None = None) -> float:
+        headers = getattr(error, "headers", None) or {}
+        retry_after = headers.get("retry-after") or headers.get("Retry-After")
+        if retry_after and retry_after.isdigit():
+            return min(float(retry_after), self.max_delay)
+
+        backoff = min(self.base_delay * (2**retry), self.max_delay)
+        return random.uniform(0, backoff) if self.jitter else backoff
+
+
+class RetryBudget(BaseModel):
+    """Caps retries to a fraction of first attempts.
+
+    Every first attempt deposits ``ratio`` tokens and every retry spends
+    one, with ``min_per_second`` tokens trickling in so low-traffic
+    callers can still retry. When the upstream is degraded the balance
+    drains and further retries are refused instead of multiplying load.
+    """
+
+    ratio: float = Field(default=0.2, ge=0)
+    min_per_second: float = Field(default=1, ge=0)
+    max_balance: float = Field(default=10, gt=0)
+
+    _balance: float = PrivateAttr(default=None)
+    _last_refill: float = PrivateAttr(default_factory=time.monotonic)
+
+    def model_post_init(self, __context: Any) -> None:
+        self._balance = self.max_balance
+
+    @property
+    def balance(self) -> float:
+        self._refill()
+        return self._balance
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._balance = min(
+            self.max_balance,
+            self._balance + (now - self._last_refill) * self.min_per_second,
+        )
+        self._last_refill = now
+
+    def deposit(self) -> None:
+        self._refill()
+        self._balance = min(self.max_balance, self._balance + self.ratio)
+
+    def try_withdraw(self) -> bool:
+        self._refill()
+        if self._balance >= 1:
+            self._balance -= 1
+            return True
+        return False
+
+
+def _record_failure(
+    circuit_breaker: CircuitBreaker, ticket: CircuitTicket, error: Exception
+):
+    # client errors say nothing about upstream health either way
+    if is_retryable(error):
+        circuit_breaker.record(ticket, failed=True)
+    else:
+        circuit_breaker.release(ticket)
+
+
+class RetryEngine(BaseModel):
+    """Retries the network step of a prepared request.
+
+    The caller prepares the request once (validation, token counting,
+    serialization, rate limit admission) and hands the engine a
+    zero-argument callable performing only the network attempt, so
+    retries never redo that work.
+    """
+
+    policy: RetryPolicy = Field(default_factory=RetryPolicy)
+    budget: RetryBudget = Field(default_factory=RetryBudget)
+
+    attempts: int = Field(default=0, description="Total attempts made")
+    retries: int = Field(default=0, description="Attempts that were retries")
+    budget_exhausted: int = Field(
+        default=0, description="Retries refused by the retry budget"
+    )
+
+    def _should_retry(self, error: BaseException, retry: int) -> bool:
+        if retry >= self.policy.max_retries or not is_retryable(error):
+            return False
+        if not self.budget.try_withdraw():
+            self.budget_exhausted += 1
+            return False
+        self.retries += 1
+        return True
+
+    async def run(
+        self,
+        attempt: Callable[[], Awaitable[T]],
+        circuit_breaker: CircuitBreaker | None = None,
+    ) -> T:
+        self.budget.deposit()
+        retry = 0
+        while True:
+            if circuit_breaker is not None:
+                ticket = circuit_breaker.allow()
+            self.attempts += 1
+            start = time.monotonic()
+            try:
+                result = await attempt()
+            except Exception as e:
+                if circuit_breaker is not None:
+                    _record_failure(circuit_breaker, ticket, e)
+                if not self._should_retry(e, retry):
+                    raise e
+                await asyncio.sleep(self.policy.delay(retry, e))
+                retry += 1
+            except BaseException:
+                if circuit_breaker is not None:
+                    circuit_breaker.release(ticket)
+                raise
+            else:
+                if circuit_breaker is not None:
+                    circuit_breaker.record(
+                        ticket, failed=False, latency=time.monotonic() - start
+                    )
+                return result
+
+    async def stream(
+        self,
+        attempt: Callable[[], AsyncIterator[dict[str, Any]]],
+        circuit_breaker: CircuitBreaker | None = None,
+    ) -> AsyncIterator[dict[str, Any]]:
+        """Retry a stream that failed before delivering any content.
+
+        The API cannot resume a generation and a retry produces a new,
+        independent one, so once content chunks have been yielded a
+        failure raises ``StreamInterruptedError`` with those chunks
+        instead of retrying. Header chunks are yielded once. The circuit
+        breaker sees the time to the first chunk as the call latency.
+        """
+        self.budget.deposit()
+        retry = 0
+        delivered: list[dict[str, Any]] = []
+        headers_sent = False
+        while True:
+            if circuit_breaker is not None:
+                ticket = circuit_breaker.allow()
+            self.attempts += 1
+            start = time.monotonic()
+            first_chunk_latency = None
+            try:
+                async for chunk in attempt():
+                    if first_chunk_latency is None:
+                        first_chunk_latency = time.monotonic() - start
+                    if "headers" in chunk:
+                        if not headers_sent:
+                            headers_sent = True
+                            yield chunk
+                        continue
+                    delivered.append(chunk)
+                    yield chunk
+            except Exception as e:
+                if circuit_breaker is not None:
+                    _record_failure(circuit_breaker, ticket, e)
+                if delivered:
+                    raise StreamInterruptedError(
+                        f"Stream interrupted after {len(delivered)} "
+                        f"chunks: {e}",
+                        chunks=delivered,
+                    ) from e
+                if not self._should_retry(e, retry):
+                    raise e
+                await asyncio.sleep(self.policy.delay(retry, e))
+                retry += 1
+            except BaseException:
+                if circuit_breaker is not None:
+                    circuit_breaker.release(ticket)
+                raise
+            else:
+                if circuit_breaker is not None:
+                    circuit_breaker.record(
+                        ticket,
+                        failed=False,
+                        latency=first_chunk_latency or 0.0,
+                    )
+                return
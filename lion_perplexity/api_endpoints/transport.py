@@ -0,0 +1,207 @@
+import asyncio
+import random
+from abc import abstractmethod
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any
+
+import aiohttp
+from pydantic import BaseModel, ConfigDict, Field, PrivateAttr
+
+
+class TransportResponse(BaseModel):
+    """Status, headers and payload returned by a transport."""
+
+    status: int = Field(description="HTTP status code.")
+    headers: dict[str, str] = Field(
+        default_factory=dict, description="Response headers, lower-cased."
+    )
+    body: bytes = Field(
+        default=b"", description="Full response body (non-streaming)."
+    )
+    lines: AsyncIterator[bytes] | None = Field(
+        default=None,
+        description="Raw SSE lines of a streaming response.",
+        exclude=True,
+    )
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+
+class Transport(BaseModel):
+    """Moves serialized requests to the API and responses back.
+
+    ``PerplexityRequest`` builds the URL, headers and body bytes and
+    delegates the network round trip to a transport, so the wire can be
+    swapped (recording, replay, fault injection) without touching the
+    request/response handling.
+    """
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @abstractmethod
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | dict[str, Any] | None = None,
+    ) -> TransportResponse:
+        """Send a request and return the fully read response."""
+
+    @abstractmethod
+    def stream(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | None = None,
+    ):
+        """Async context manager yielding a response with ``lines`` set."""
+
+    async def close(self) -> None:
+        """Release any resources held by the transport."""
+
+
+class AiohttpTransport(Transport):
+    """Default transport backed by ``aiohttp``.
+
+    By default every call opens and closes its own ``ClientSession``.
+    With ``pooled=True`` one session (and its connection pool) is created
+    lazily and reused until ``close()``; it is bound to the event loop
+    that created it.
+    """
+
+    pooled: bool = Field(
+        default=False, description="Reuse one session across calls"
+    )
+    connection_limit: int = Field(
+        default=100, description="Max connections of the pooled session"
+    )
+
+    _session: aiohttp.ClientSession | None = PrivateAttr(default=None)
+
+    @asynccontextmanager
+    async def _client(self):
+        if not self.pooled:
+            async with aiohttp.ClientSession() as client:
+                yield client
+            return
+
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.connection_limit)
+            )
+        yield self._session
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | dict[str, Any] | None = None,
+    ) -> TransportResponse:
+        async with self._client() as client:
+            async with client.request(
+                method=method, url=url, headers=headers, data=data
+            ) as response:
+                return TransportResponse(
+                    status=response.status,
+                    headers={
+                        k.lower(): v for k, v in response.headers.items()
+                    },
+                    body=await response.read(),
+                )
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | None = None,
+    ):
+        async with self._client() as client:
+            async with client.request(
+                method=method, url=url, headers=headers, data=data
+            ) as response:
+                yield TransportResponse(
+                    status=response.status,
+                    headers={
+                        k.lower(): v for k, v in response.headers.items()
+                    },
+                    body=(
+                        await response.read()
+                        if response.status != 200
+                        else b""
+                    ),
+                    lines=aiter(response.content),
+                )
+
+
+class FaultInjectingTransport(Transport):
+    """Wrap ``transport`` and fail a share of requests on purpose.
+
+    Failed calls return ``error_status`` after ``failure_latency``
+    seconds, which mimics an upstream that times out or errors, so retry
+    and circuit breaker behaviour can be exercised locally.
+    """
+
+    transport: Transport = Field(description="Transport for healthy calls")
+    failure_rate: float = Field(default=0.0, ge=0, le=1)
+    error_status: int = Field(default=503)
+    failure_latency: float = Field(default=0.0, ge=0)
+    seed: int | None = Field(default=None)
+
+    calls: int = Field(default=0, description="Calls that reached upstream")
+
+    _random: random.Random = PrivateAttr()
+
+    def model_post_init(self, __context: Any) -> None:
+        self._random = random.Random(self.seed)
+
+    def _fault(self) -> TransportResponse | None:
+        self.calls += 1
+        if self._random.random() < self.failure_rate:
+            return TransportResponse(
+                status=self.error_status,
+                body=b'{"error": {"message": "injected fault"}}',
+            )
+        return None
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | dict[str, Any] | None = None,
+    ) -> TransportResponse:
+        if (fault := self._fault()) is not None:
+            await asyncio.sleep(self.failure_latency)
+            return fault
+        return await self.transport.request(method, url, headers, data)
+
+    @asynccontextmanager
+    async def stream(
+        self,
+        method: str,
+        url: str,
+        headers: dict[str, str],
+        data: bytes | None = None,
+    ):
+        if (fault := self._fault()) is not None:
+            await asyncio.sleep(self.failure_latency)
+            yield fault
+            return
+        async with self.transport.stream(
+            method, url, headers, data
+        ) as response:
+            yield response
+
+    async def close(self) -> None:
+        await self.transport.close()
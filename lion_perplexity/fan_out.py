@@ -0,0 +1,192 @@
+# Copyright (c) 2023 - 2024, HaiyangLi <quantocean.li at gmail dot com>
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+from collections.abc import AsyncIterator
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from .analytics.citation_index import normalize_url
+from .api_endpoints.chat_completions.request.request_body import (
+    PerplexityChatCompletionRequestBody,
+)
+from .api_endpoints.chat_completions.response.response_body import (
+    PerplexityChatCompletionResponseBody,
+)
+from .api_endpoints.data_models import Usage
+from .PerplexityModel import PerplexityModel
+
+
+class FanOutResult(BaseModel):
+    """Outcome of one sub-query."""
+
+    index: int = Field(description="Position of the sub-query.")
+    request_body: PerplexityChatCompletionRequestBody
+    response: PerplexityChatCompletionResponseBody | None = None
+    error: Exception | None = None
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def content(self) -> str | None:
+        if self.response is None:
+            return None
+        return self.response.choices[0].message.content
+
+
+class MergedChatCompletion(BaseModel):
+    """Answers of a fan-out with citations and questions deduplicated."""
+
+    answers: list[FanOutResult] = Field(
+        default_factory=list, description="Successful sub-queries."
+    )
+    errors: list[FanOutResult] = Field(
+        default_factory=list, description="Failed sub-queries."
+    )
+    cancelled: list[int] = Field(
+        default_factory=list,
+        description="Sub-queries cancelled by early termination.",
+    )
+    citations: list[str] = Field(
+        default_factory=list,
+        description="Citation URLs in order of first appearance, "
+        "deduplicated by normalized URL.",
+    )
+    related_questions: list[str] = Field(default_factory=list)
+    usage: Usage = Field(
+        default_factory=lambda: Usage(
+            prompt_tokens=0, completion_tokens=0, total_tokens=0
+        )
+    )
+
+
+class ChatCompletionFanOut:
+    """Run sub-queries concurrently and merge them as they finish.
+
+    Iterating yields a ``FanOutResult`` per sub-query in completion
+    order. Iteration stops early, cancelling what is still running, once
+    ``quorum`` sub-queries have succeeded or ``token_budget`` total
+    tokens have been used. ``merged()`` runs the fan-out to completion
+    (if it is not already) and returns the merged result.
+
+    All sub-queries go through the same ``PerplexityModel`` and thus the
+    same rate limiter, retry engine and circuit breaker.
+    """
+
+    def __init__(
+        self,
+        perplexity_model: PerplexityModel,
+        request_bodies: list[PerplexityChatCompletionRequestBody],
+        quorum: int | None = None,
+        token_budget: int | None = None,
+        max_concurrency: int | None = None,
+    ):
+        if not request_bodies:
+            raise ValueError("At least one sub-query is required")
+        if any(body.stream for body in request_bodies):
+            raise ValueError("Fan-out sub-queries cannot be streamed")
+        if quorum is not None and not 0 < quorum <= len(request_bodies):
+            raise ValueError(
+                f"Quorum must be between 1 and {len(request_bodies)}"
+            )
+
+        self.perplexity_model = perplexity_model
+        self.request_bodies = request_bodies
+        self.quorum = quorum
+        self.token_budget = token_budget
+        self.max_concurrency = max_concurrency
+        self.result = MergedChatCompletion()
+
+        self._seen_citations: set[str] = set()
+        self._seen_questions: set[str] = set()
+        self._started = False
+
+    def _done(self) -> bool:
+        if self.quorum and len(self.result.answers) >= self.quorum:
+            return True
+        if self.token_budget is not None:
+            return self.result.usage.total_tokens >= self.token_budget
+        return False
+
+    def _merge(self, result: FanOutResult) -> None:
+        if result.response is None:
+            self.result.errors.append(result)
+            return
+
+        self.result.answers.append(result)
+        response = result.response
+
+        usage = self.result.usage
+        usage.prompt_tokens += response.usage.prompt_tokens
+        usage.completion_tokens += response.usage.completion_tokens
+        usage.total_tokens += response.usage.total_tokens
+
+        for citation in response.citations or ():
+            url = (
+                citation
+                if isinstance(citation, str)
+                else (
+                    citation.get("url")
+                    if isinstance(citation, dict)
+                    else citation.url
+                )
+            )
+            if url and (key := normalize_url(url)) not in self._seen_citations:
+                self._seen_citations.add(key)
+                self.result.citations.append(url)
+
+        for question in response.related_questions or ():
+            key = " ".join(question.text.lower().split())
+            if key not in self._seen_questions:
+                self._seen_questions.add(key)
+                self.result.related_questions.append(question.text)
+
+    async def _run_one(
+        self, index: int, semaphore: asyncio.Semaphore | None
+    ) -> FanOutResult:
+        body = self.request_bodies[index]
+        try:
+            if semaphore is None:
+                response = await self.perplexity_model.invoke(body)
+            else:
+                async with semaphore:
+                    response = await self.perplexity_model.invoke(body)
+        except Exception as e:
+            return FanOutResult(index=index, request_body=body, error=e)
+        return FanOutResult(index=index, request_body=body, response=response)
+
+    async def __aiter__(self) -> AsyncIterator[FanOutResult]:
+        if self._started:
+            raise RuntimeError("A fan-out can only be iterated once")
+        self._started = True
+
+        semaphore = (
+            asyncio.Semaphore(self.max_concurrency)
+            if self.max_concurrency
+            else None
+        )
+        tasks = {
+            asyncio.create_task(self._run_one(i, semaphore)): i
+            for i in range(len(self.request_bodies))
+        }
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                result = await next_done
+                self._merge(result)
+                yield result
+                if self._done():
+                    break
+        finally:
+            for task, index in tasks.items():
+                if not task.done():
+                    task.cancel()
+                    self.result.cancelled.append(index)
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.result.cancelled.sort()
+
+    async def merged(self) -> MergedChatCompletion:
+        if not self._started:
+            async for _ in self:
+                pass
+        return self.result
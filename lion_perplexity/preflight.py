@@ -0,0 +1,231 @@
+# Copyright (c) 2023 - 2024, HaiyangLi <quantocean.li at gmail dot com>
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import math
+import multiprocessing
+import os
+from array import array
+from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Any
+
+import tiktoken
+from pydantic import BaseModel, ConfigDict, Field, ValidationError
+
+from .api_endpoints.chat_completions.request.request_body import (
+    PerplexityChatCompletionRequestBody,
+)
+from .PerplexityModel import load_max_output_token_config, load_price_config
+
+
+def _count_tokens(encoding_name: str, texts: list[str]) -> list[int]:
+    """Token count per text, -1 for texts invoke would fail to encode.
+
+    Special tokens are disallowed, as with ``TiktokenCalculator``.
+    """
+    encoding = tiktoken.get_encoding(encoding_name)
+    try:
+        return [len(tokens) for tokens in encoding.encode_batch(texts)]
+    except ValueError:
+        pass
+    counts = []
+    for text in texts:
+        try:
+            counts.append(len(encoding.encode(text)))
+        except ValueError:
+            counts.append(-1)
+    return counts
+
+
+def _zeros(typecode: str, length: int) -> array:
+    return array(typecode, bytes(length * array(typecode).itemsize))
+
+
+def _error_message(error: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(map(str, e['loc'])) or 'body'}: {e['msg']}"
+        for e in error.errors()
+    )
+
+
+class PreflightReport(BaseModel):
+    """Per-row validation errors, token counts and costs of a batch.
+
+    Token and cost columns are ``array`` objects with one entry per input
+    row; invalid rows count zero tokens and cost nothing. Rows of models
+    without price data are valid but cost NaN, and are left out of
+    ``total_cost``.
+    """
+
+    request_bodies: list[PerplexityChatCompletionRequestBody | None] = Field(
+        description="Validated bodies, None for invalid rows."
+    )
+    input_tokens: array = Field(description="Prompt tokens per row.")
+    output_tokens: array = Field(description="Reserved output tokens per row.")
+    costs: array = Field(description="Estimated cost per row.")
+    errors: dict[int, str] = Field(
+        default_factory=dict, description="Error message by row index."
+    )
+
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    @property
+    def valid_bodies(self) -> list[PerplexityChatCompletionRequestBody]:
+        return [body for body in self.request_bodies if body is not None]
+
+    @property
+    def total_input_tokens(self) -> int:
+        return sum(self.input_tokens)
+
+    @property
+    def total_output_tokens(self) -> int:
+        return sum(self.output_tokens)
+
+    @property
+    def total_cost(self) -> float:
+        return math.fsum(cost for cost in self.costs if not math.isnan(cost))
+
+    @property
+    def unpriced_rows(self) -> list[int]:
+        return [row for row, cost in enumerate(self.costs) if math.isnan(cost)]
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "rows": len(self.request_bodies),
+            "valid": len(self.request_bodies) - len(self.errors),
+            "invalid": len(self.errors),
+            "input_tokens": self.total_input_tokens,
+            "output_tokens": self.total_output_tokens,
+            "cost": self.total_cost,
+            "unpriced": len(self.unpriced_rows),
+        }
+
+
+def count_tokens(
+    texts: list[str],
+    encoding_name: str = "cl100k_base",
+    max_workers: int | None = None,
+    parallel_threshold: int = 5000,
+) -> list[int]:
+    """Count tokens of many texts with batched tokenization.
+
+    Batches of at least ``parallel_threshold`` texts are split across a
+    process pool; smaller ones are encoded in this process, where
+    ``encode_batch`` already spreads work over native threads. Workers
+    are spawned rather than forked, as forking a process that runs
+    threads (event loops, aiohttp, tiktoken's pool) can deadlock. Texts
+    containing special tokens count -1, since invoke would reject them.
+    """
+    if len(texts) < parallel_threshold:
+        return _count_tokens(encoding_name, texts)
+
+    max_workers = max_workers or os.cpu_count() or 1
+    chunk_size = -(-len(texts) // (max_workers * 4))
+    chunks = [
+        texts[i : i + chunk_size] for i in range(0, len(texts), chunk_size)
+    ]
+    counts = []
+    with ProcessPoolExecutor(
+        max_workers=max_workers,
+        mp_context=multiprocessing.get_context("spawn"),
+    ) as executor:
+        for chunk_counts in executor.map(
+            partial(_count_tokens, encoding_name), chunks
+        ):
+            counts.extend(chunk_counts)
+    return counts
+
+
+def preflight(
+    request_bodies: Iterable[PerplexityChatCompletionRequestBody | dict],
+    estimated_output_len: int = 0,
+    limit_tokens: int | None = None,
+    encoding_name: str = "cl100k_base",
+    max_workers: int | None = None,
+    parallel_threshold: int = 5000,
+) -> PreflightReport:
+    """Validate, token-count and price a batch before sending any of it.
+
+    Rows may be request bodies or plain dicts; dicts go through the same
+    validators as at invoke time and failures are reported per row
+    instead of raised. Input tokens are counted over message contents,
+    as ``PerplexityModel.get_input_token_len`` does. The reserved output
+    is ``max_tokens`` if set, else ``estimated_output_len``, else the
+    model's configured maximum. Rows with special tokens in a message,
+    or whose reservation exceeds ``limit_tokens``, are reported as
+    errors, since invoke would reject them.
+    """
+    prices = load_price_config()["model"]
+    max_output_tokens = load_max_output_token_config()
+
+    bodies: list[PerplexityChatCompletionRequestBody | None] = []
+    errors: dict[int, str] = {}
+    texts: list[str] = []
+    text_rows = array("l")
+    for row, body in enumerate(request_bodies):
+        if not isinstance(body, PerplexityChatCompletionRequestBody):
+            try:
+                body = PerplexityChatCompletionRequestBody.model_validate(body)
+            except ValidationError as e:
+                errors[row] = _error_message(e)
+                bodies.append(None)
+                continue
+        bodies.append(body)
+        for message in body.messages:
+            texts.append(message.content)
+            text_rows.append(row)
+
+    input_tokens = _zeros("l", len(bodies))
+    if texts:
+        counts = count_tokens(
+            texts,
+            encoding_name=encoding_name,
+            max_workers=max_workers,
+            parallel_threshold=parallel_threshold,
+        )
+        for row, count in zip(text_rows, counts):
+            if count < 0:
+                errors[row] = "Message content contains special tokens"
+                bodies[row] = None
+            elif bodies[row] is not None:
+                input_tokens[row] += count
+        for row in errors:
+            input_tokens[row] = 0
+
+    output_tokens = _zeros("l", len(bodies))
+    costs = _zeros("d", len(bodies))
+    for row, body in enumerate(bodies):
+        if body is None:
+            continue
+        output_len = (
+            body.max_tokens
+            or estimated_output_len
+            or max_output_tokens.get(body.model, 0)
+        )
+        requested = input_tokens[row] + output_len
+        if limit_tokens and requested > limit_tokens:
+            errors[row] = (
+                f"Requested tokens ({requested}) exceed the token limit "
+                f"({limit_tokens})"
+            )
+            bodies[row] = None
+            input_tokens[row] = 0
+            continue
+        output_tokens[row] = output_len
+        if (price := prices.get(body.model)) is None:
+            costs[row] = math.nan
+            continue
+        costs[row] = (
+            price["input_tokens"] * input_tokens[row]
+            + price["output_tokens"] * output_len
+        )
+
+    return PreflightReport(
+        request_bodies=bodies,
+        input_tokens=input_tokens,
+        output_tokens=output_tokens,
+        costs=costs,
+        errors=dict(sorted(errors.items())),
+    )
@@ -0,0 +1,193 @@
+# Copyright (c) 2023 - 2024, HaiyangLi <quantocean.li at gmail dot com>
+#
+# SPDX-License-Identifier: Apache-2.0
+
+import asyncio
+import queue
+import threading
+from collections.abc import Coroutine, Iterable, Iterator
+from typing import Any, TypeVar
+
+from .api_endpoints.chat_completions.request.request_body import (
+    PerplexityChatCompletionRequestBody,
+)
+from .api_endpoints.coalescer import RequestCoalescer
+from .api_endpoints.transport import AiohttpTransport, Transport
+from .PerplexityModel import PerplexityModel
+
+T = TypeVar("T")
+
+_STREAM_END = object()
+
+
+class SyncPerplexityClient:
+    """Blocking facade over a ``PerplexityModel`` for non-async callers.
+
+    One daemon thread runs a persistent event loop; every call from any
+    thread is scheduled onto it with ``run_coroutine_threadsafe``, so
+    there is no loop or session setup per call, and the client is safe
+    to share across threads.
+
+    The client calls through a shallow copy of ``perplexity_model``
+    bound to ``transport``. Without one, a default per-call
+    ``AiohttpTransport`` is replaced by a pooled one the client creates.
+    The caller's model is left untouched, and ``close()`` only closes a
+    transport the client created.
+
+    The copy gets its own ``RequestCoalescer``, whose in-flight tasks
+    belong to one event loop. It shares the rate limiter, output
+    estimator, retry engine and circuit breaker with the original,
+    which are not locked: while the client is in use, do not call the
+    original model from another thread or event loop.
+    """
+
+    def __init__(
+        self,
+        perplexity_model: PerplexityModel,
+        timeout: float | None = None,
+        transport: Transport | None = None,
+    ):
+        self.timeout = timeout
+
+        request_model = perplexity_model.request_model
+        self._owns_transport = False
+        if transport is None:
+            transport = request_model.transport
+            if type(transport) is AiohttpTransport and not transport.pooled:
+                transport = AiohttpTransport(pooled=True)
+                self._owns_transport = True
+        update = {
+            "request_model": request_model.model_copy(
+                update={"transport": transport}
+            )
+        }
+        if perplexity_model.coalescer is not None:
+            update["coalescer"] = RequestCoalescer()
+        self.perplexity_model = perplexity_model.model_copy(update=update)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(
+            target=self._loop.run_forever,
+            name="perplexity-sync-client",
+            daemon=True,
+        )
+        self._thread.start()
+        self._closed = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def run(self, coro: Coroutine[Any, Any, T]) -> T:
+        """Run a coroutine on the client loop and wait for its result."""
+        if self._closed:
+            coro.close()
+            raise RuntimeError("Client is closed")
+        future = asyncio.run_coroutine_threadsafe(coro, self._loop)
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            future.cancel()
+            raise
+
+    def invoke(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        estimated_output_len: int = 0,
+        output_file=None,
+        parse_response=True,
+    ):
+        return self.run(
+            self.perplexity_model.invoke(
+                request_body,
+                estimated_output_len=estimated_output_len,
+                output_file=output_file,
+                parse_response=parse_response,
+            )
+        )
+
+    def stream(
+        self,
+        request_body: PerplexityChatCompletionRequestBody,
+        estimated_output_len: int = 0,
+        output_file=None,
+    ) -> Iterator[dict[str, Any]]:
+        """Yield stream chunks as they arrive on the loop thread.
+
+        Closing the iterator early, or waiting longer than ``timeout``
+        for a chunk (``TimeoutError``), cancels the underlying request.
+        """
+        chunks: queue.Queue = queue.Queue()
+
+        async def pump():
+            try:
+                async for chunk in self.perplexity_model.open_stream(
+                    request_body,
+                    estimated_output_len=estimated_output_len,
+                    output_file=output_file,
+                ):
+                    chunks.put(chunk)
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(_STREAM_END)
+
+        if self._closed:
+            raise RuntimeError("Client is closed")
+        future = asyncio.run_coroutine_threadsafe(pump(), self._loop)
+        try:
+            while True:
+                try:
+                    item = chunks.get(timeout=self.timeout)
+                except queue.Empty:
+                    raise TimeoutError(
+                        f"No stream chunk within {self.timeout}s"
+                    ) from None
+                if item is _STREAM_END:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            if not future.done():
+                future.cancel()
+
+    def map(
+        self,
+        request_bodies: Iterable[PerplexityChatCompletionRequestBody],
+        max_concurrency: int | None = None,
+        return_exceptions: bool = False,
+    ) -> list:
+        """Invoke a batch concurrently and return results in order."""
+
+        async def run_all():
+            semaphore = (
+                asyncio.Semaphore(max_concurrency) if max_concurrency else None
+            )
+
+            async def one(body):
+                if semaphore is None:
+                    return await self.perplexity_model.invoke(body)
+                async with semaphore:
+                    return await self.perplexity_model.invoke(body)
+
+            return await asyncio.gather(
+                *(one(body) for body in request_bodies),
+                return_exceptions=return_exceptions,
+            )
+
+        return self.run(run_all())
+
+    def close(self) -> None:
+        if self._closed:
+            return
+        try:
+            if self._owns_transport:
+                self.run(self.perplexity_model.request_model.transport.close())
+        finally:
+            self._closed = True
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
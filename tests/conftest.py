@@ -0,0 +1,132 @@
+import asyncio
+import json
+import threading
+from contextlib import asynccontextmanager
+
+from lion_service.token_calculator import TiktokenCalculator
+from pydantic import Field
+
+from lion_perplexity.api_endpoints.chat_completions.request.request_body import (
+    PerplexityChatCompletionRequestBody,
+)
+from lion_perplexity.api_endpoints.transport import (
+    Transport,
+    TransportResponse,
+)
+from lion_perplexity.PerplexityModel import PerplexityModel
+
+MODEL = "llama-3.1-sonar-small-128k-online"
+# the rate limiter parses the date header of every response
+DATE = "Mon, 19 Oct 2026 10:00:00 GMT"
+USAGE = {"prompt_tokens": 1, "completion_tokens": 9, "total_tokens": 10}
+
+
+class WordCounter(TiktokenCalculator):
+    """Counts words, so tests need no downloaded encoding."""
+
+    def calculate(self, text: str) -> int:
+        return len(text.split())
+
+
+def completion(content: str = "answer", **fields) -> dict:
+    """A chat completion response body."""
+    return {
+        "id": "x",
+        "model": MODEL,
+        "object": "chat.completion",
+        "created": 0,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": USAGE,
+        **fields,
+    }
+
+
+def chunk(content: str) -> dict:
+    """A streamed chat completion chunk."""
+    return {
+        "id": "x",
+        "choices": [{"index": 0, "delta": {"content": content}}],
+    }
+
+
+class CompletionTransport(Transport):
+    """Answers every call with a chat completion after ``delay`` seconds.
+
+    Subclasses override ``answer`` to pick the content per prompt; it
+    may return a ``TransportResponse`` instead, e.g. an error. Streams
+    send one chunk per entry of ``deltas``, sleeping ``delay`` before
+    each, and set ``stream_closed`` once the stream is done with.
+    """
+
+    status: int = 200
+    delay: float = 0.0
+    usage: dict = USAGE
+    deltas: list[str] = ["ans", "wer"]
+
+    calls: int = 0
+    bodies: list = []
+    stream_closed: threading.Event = Field(default_factory=threading.Event)
+
+    async def answer(self, prompt: str) -> str | TransportResponse:
+        return "answer"
+
+    async def request(self, method, url, headers, data=None):
+        self.calls += 1
+        self.bodies.append(data)
+        if self.status != 200:
+            return TransportResponse(
+                status=self.status, body=b'{"error": {"message": "failed"}}'
+            )
+        await asyncio.sleep(self.delay)
+        prompt = json.loads(data)["messages"][-1]["content"]
+        content = await self.answer(prompt)
+        if isinstance(content, TransportResponse):
+            return content
+        return TransportResponse(
+            status=200,
+            headers={"date": DATE},
+            body=json.dumps(completion(content, usage=self.usage)).encode(),
+        )
+
+    @asynccontextmanager
+    async def stream(self, method, url, headers, data=None):
+        self.calls += 1
+        self.bodies.append(data)
+
+        async def lines():
+            try:
+                for content in self.deltas:
+                    await asyncio.sleep(self.delay)
+                    yield f"data: {json.dumps(chunk(content))}\n".encode()
+                    yield b"\n"
+            finally:
+                self.stream_closed.set()
+
+        yield TransportResponse(
+            status=self.status, headers={"date": DATE}, lines=lines()
+        )
+
+
+def make_body(content: str = "hi", **fields):
+    return PerplexityChatCompletionRequestBody(
+        model=MODEL, messages=[{"role": "user", "content": content}], **fields
+    )
+
+
+def make_model(transport: Transport | None = None, **fields):
+    model = PerplexityModel(
+        model=MODEL,
+        api_key="key",
+        endpoint="chat/completions",
+        method="POST",
+        transport=transport,
+        **fields,
+    )
+    model.text_token_calculator = WordCounter(encoding_name="cl100k_base")
+    return model
@@ -0,0 +1,122 @@
+import pytest
+
+from lion_perplexity.api_endpoints.api_request import (
+    PerplexityAPIError,
+    PerplexityRequest,
+)
+from lion_perplexity.api_endpoints.circuit_breaker import (
+    CircuitBreaker,
+    CircuitOpenError,
+    CircuitState,
+)
+from lion_perplexity.api_endpoints.retry import RetryEngine, RetryPolicy
+from lion_perplexity.api_endpoints.transport import FaultInjectingTransport
+from tests.conftest import CompletionTransport, chunk, completion, make_body
+
+
+async def call(request, engine, breaker):
+    return await engine.run(
+        lambda: request.invoke(json_data=make_body()),
+        circuit_breaker=breaker,
+    )
+
+
+async def test_breaker_opens_sheds_load_and_recovers():
+    faults = FaultInjectingTransport(
+        transport=CompletionTransport(), failure_rate=1
+    )
+    request = PerplexityRequest(
+        api_key="key",
+        endpoint="chat/completions",
+        method="POST",
+        transport=faults,
+    )
+    engine = RetryEngine(policy=RetryPolicy(max_retries=0))
+    breaker = CircuitBreaker(minimum_calls=5, open_duration=60)
+
+    for _ in range(5):
+        with pytest.raises(PerplexityAPIError):
+            await call(request, engine, breaker)
+    assert breaker.state is CircuitState.OPEN
+
+    for _ in range(20):
+        with pytest.raises(CircuitOpenError):
+            await call(request, engine, breaker)
+    assert faults.calls == 5
+    assert breaker.health()["rejected"] == 20
+
+    # upstream heals; after the open period a probe closes the circuit
+    faults.failure_rate = 0
+    breaker.open_duration = 0
+    assert await call(request, engine, breaker) == completion()
+    assert breaker.state is CircuitState.CLOSED
+
+
+async def test_failed_probe_reopens():
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=0)
+    breaker.record(breaker.allow(), failed=True)
+    assert breaker.state is CircuitState.OPEN
+
+    probe = breaker.allow()
+    assert breaker.state is CircuitState.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # only one probe at a time
+    breaker.record(
+        probe, failed=False, latency=breaker.slow_call_threshold + 1
+    )
+    assert breaker.state is CircuitState.OPEN
+
+
+async def test_stale_outcomes_do_not_settle_the_probe():
+    breaker = CircuitBreaker(minimum_calls=2, open_duration=0)
+    first, second, stale = (breaker.allow() for _ in range(3))
+    breaker.record(first, failed=True)
+    breaker.record(second, failed=True)
+    assert breaker.state is CircuitState.OPEN
+
+    probe = breaker.allow()
+    assert breaker.state is CircuitState.HALF_OPEN
+    # the older call finishing now is not the probe, whatever its outcome
+    breaker.record(stale, failed=False)
+    assert breaker.state is CircuitState.HALF_OPEN
+    breaker.record(stale, failed=True)
+    assert breaker.state is CircuitState.HALF_OPEN
+    breaker.release(stale)
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()  # the probe slot is still taken
+
+    breaker.record(probe, failed=False)
+    assert breaker.state is CircuitState.CLOSED
+    # a probe-era ticket is stale once the circuit has closed
+    breaker.record(probe, failed=True)
+    assert breaker.health()["calls"] == 0
+
+
+async def test_client_error_probe_does_not_close_the_circuit():
+    upstream = CompletionTransport(status=400)
+    request = PerplexityRequest(
+        api_key="key",
+        endpoint="chat/completions",
+        method="POST",
+        transport=upstream,
+    )
+    engine = RetryEngine(policy=RetryPolicy(max_retries=0))
+    breaker = CircuitBreaker(minimum_calls=1, open_duration=0)
+    breaker.record(breaker.allow(), failed=True)
+
+    for _ in range(2):
+        with pytest.raises(PerplexityAPIError):
+            await call(request, engine, breaker)
+        # the probe slot is released, but the circuit stays half-open
+        assert breaker.state is CircuitState.HALF_OPEN
+
+    upstream.status = 200
+    chunks = [
+        c
+        async for c in engine.stream(
+            lambda: request.stream(json_data=make_body(), verbose=False),
+            circuit_breaker=breaker,
+        )
+    ]
+    assert chunks == [chunk("ans"), chunk("wer")]
+    assert breaker.state is CircuitState.CLOSED
@@ -0,0 +1,92 @@
+import pytest
+from pydantic import ValidationError
+
+from lion_perplexity.analytics.citation_index import (
+    CitationIndex,
+    citation_domain,
+    normalize_url,
+)
+from lion_perplexity.api_endpoints.chat_completions.response.response_body import (
+    PerplexityChatCompletionResponseBody,
+)
+
+
+def response(citations):
+    return {
+        "id": "r",
+        "model": "llama-3.1-sonar-small-128k-online",
+        "object": "chat.completion",
+        "created": 0,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": "answer"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 1,
+            "completion_tokens": 1,
+            "total_tokens": 2,
+        },
+        "citations": citations,
+    }
+
+
+def test_normalize_url():
+    assert (
+        normalize_url("HTTP://WWW.Example.com:80/a/?utm_source=x&b=2&a=1#top")
+        == "https://example.com/a?a=1&b=2"
+    )
+    assert normalize_url("example.com/") == "https://example.com"
+
+
+def test_index_dedups_and_counts_domains():
+    index = CitationIndex(capacity=4)
+    urls = [f"https://site{i % 50 % 7}.org/page/{i % 50}" for i in range(1000)]
+    urls += ["http://www.site0.org/page/0/?utm_medium=email"] * 10
+    for url in urls:
+        index.add(url)
+
+    assert len(index) == 50
+    assert index.total == 1010
+    assert index.count("https://site0.org/page/0") == 30
+    assert index.domain_count("www.site0.org") == 170
+    assert index.top_urls(1) == [("https://site0.org/page/0", 30)]
+    assert index.suggest_domain_filter(1) == ["site0.org"]
+    assert index.suggest_domain_filter(1, exclude=True) == ["-site0.org"]
+
+
+def test_citation_domain_matches_the_index():
+    urls = [
+        "example.com/x",
+        "https://WWW.Example.com./y",
+        "http://example.com:8080/z",
+    ]
+    index = CitationIndex()
+    for url in urls:
+        index.add(url)
+        assert citation_domain(url) == "example.com"
+    assert index.domain_count("example.com") == 3
+
+
+def test_citation_cap():
+    data = response([f"https://a.example/{i}" for i in range(25)])
+
+    # no cap by default
+    body = PerplexityChatCompletionResponseBody.model_validate(data)
+    assert len(body.citations) == 25
+
+    class Capped(PerplexityChatCompletionResponseBody):
+        max_citations = 20
+
+    with pytest.raises(ValidationError, match="Too many citations"):
+        Capped.model_validate(data)
+
+    with pytest.raises(ValidationError, match=r"\(25 > 10\)"):
+        PerplexityChatCompletionResponseBody.model_validate(
+            data, context={"max_citations": 10}
+        )
+    # the context overrides a class cap either way
+    body = Capped.model_validate(data, context={"max_citations": None})
+    assert len(body.citations) == 25
@@ -0,0 +1,82 @@
+import asyncio
+
+from lion_perplexity.api_endpoints.coalescer import RequestCoalescer
+from tests.conftest import CompletionTransport, make_body, make_model
+
+
+async def test_run_shares_one_call():
+    coalescer = RequestCoalescer()
+    calls = 0
+
+    async def call():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": "a", "usage": {"total_tokens": 10}}
+
+    key = coalescer.key(b'{"model": "m"}')
+    results = await asyncio.gather(
+        *(coalescer.run(key, call) for _ in range(5))
+    )
+    # a later call starts a new flight
+    await coalescer.run(key, call)
+
+    assert calls == 2
+    assert [shared for _, shared in results] == [False] + [True] * 4
+    assert all(result == results[0][0] for result, _ in results)
+    assert len({id(result) for result, _ in results}) == 5
+    assert coalescer.stats.coalesced == 4
+    assert coalescer.stats.saved_tokens == 40
+
+
+async def test_stream_late_joiner_gets_prefix_and_tail():
+    coalescer = RequestCoalescer()
+    opened = 0
+
+    async def open_stream():
+        nonlocal opened
+        opened += 1
+        for i in range(4):
+            await asyncio.sleep(0.01)
+            yield {"i": i}
+
+    async def consume(delay):
+        await asyncio.sleep(delay)
+        chunks = []
+        async for chunk in coalescer.stream(b"key", open_stream):
+            chunks.append(chunk["i"])
+            # mutations must not leak into other consumers
+            chunk["i"] = None
+        return chunks
+
+    first, late = await asyncio.gather(consume(0), consume(0.025))
+
+    assert opened == 1
+    assert first == late == [0, 1, 2, 3]
+    assert coalescer.stats.upstream_calls == 1
+
+
+async def test_identical_invokes_are_admitted_and_accounted_once():
+    transport = CompletionTransport(delay=0.01)
+    model = make_model(
+        transport, limit_tokens=100_000, coalescer=RequestCoalescer()
+    )
+    admissions = 0
+    admit = model.admit
+
+    async def counting_admit(*args, **kwargs):
+        nonlocal admissions
+        admissions += 1
+        return await admit(*args, **kwargs)
+
+    object.__setattr__(model, "admit", counting_admit)
+    body = make_body("same question")
+
+    responses = await asyncio.gather(*(model.invoke(body) for _ in range(5)))
+
+    assert transport.calls == 1
+    assert admissions == 1
+    assert len(model.rate_limiter.unreleased_requests) == 1
+    assert model.rate_limiter.remaining_tokens == 100_000 - 10
+    assert {r.choices[0].message.content for r in responses} == {"answer"}
+    assert model.coalescer.stats.saved_tokens == 40
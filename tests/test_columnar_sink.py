@@ -0,0 +1,108 @@
+import csv
+import math
+
+import pytest
+
+from lion_perplexity.analytics import columnar_sink
+from lion_perplexity.analytics.columnar_sink import CompletionColumnarSink
+
+SMALL = "llama-3.1-sonar-small-128k-online"
+LARGE = "llama-3.1-sonar-large-128k-online"
+
+
+def response(i, model):
+    return {
+        "id": f"r{i}",
+        "model": model,
+        "object": "chat.completion",
+        "created": i,
+        "choices": [
+            {
+                "index": 0,
+                "message": {"role": "assistant", "content": f"answer {i}"},
+                "finish_reason": "stop",
+            }
+        ],
+        "usage": {
+            "prompt_tokens": 10,
+            "completion_tokens": 20,
+            "total_tokens": 30,
+        },
+        "citations": ["https://www.a.example/x", "https://b.example/y"],
+    }
+
+
+RESPONSES = [response(i, SMALL if i % 2 else LARGE) for i in range(5)]
+
+
+def check_aggregates(sink):
+    assert sink.tokens_by_model()[SMALL] == {
+        "requests": 2,
+        "prompt_tokens": 20,
+        "completion_tokens": 40,
+        "total_tokens": 60,
+    }
+    assert sink.tokens_by_model()[LARGE]["requests"] == 3
+    assert sink.cost_by_model()[SMALL] == pytest.approx(
+        20 * 0.000001 + 40 * 0.000002
+    )
+    assert sink.citation_domain_histogram() == [
+        ("a.example", 5),
+        ("b.example", 5),
+    ]
+
+
+@pytest.mark.parametrize("numpy", [True, False])
+def test_csv_round_trip_and_aggregates(tmp_path, monkeypatch, numpy):
+    if not numpy:
+        monkeypatch.setattr(columnar_sink, "np", None)
+    path = tmp_path / "out.csv"
+    with CompletionColumnarSink(path, format="csv", batch_size=2) as sink:
+        sink.extend(RESPONSES)
+        # two full batches flushed, one row still buffered
+        assert sink.rows_written == 4
+        assert len(sink) == 1
+    check_aggregates(sink)
+
+    with open(path, newline="", encoding="utf-8") as file:
+        rows = list(csv.DictReader(file))
+    assert [row["id"] for row in rows] == [f"r{i}" for i in range(5)]
+    assert rows[1]["model"] == SMALL
+    assert rows[0]["total_tokens"] == "30"
+    assert rows[0]["citation_urls"] == (
+        "https://www.a.example/x https://b.example/y"
+    )
+
+
+def test_parquet_round_trip(tmp_path):
+    pq = pytest.importorskip("pyarrow.parquet")
+    path = tmp_path / "out.parquet"
+    with CompletionColumnarSink(path, format="parquet", batch_size=2) as sink:
+        sink.extend(RESPONSES)
+    check_aggregates(sink)
+
+    table = pq.read_table(path)
+    assert pq.ParquetFile(path).num_row_groups == 3
+    assert table.column("id").to_pylist() == [f"r{i}" for i in range(5)]
+    assert table.column("completion_tokens").to_pylist() == [20] * 5
+    assert table.column("citation_urls").to_pylist()[0] == [
+        "https://www.a.example/x",
+        "https://b.example/y",
+    ]
+
+    # writing after close must not truncate the file
+    with pytest.raises(ValueError):
+        sink.add(RESPONSES[0])
+    with pytest.raises(ValueError):
+        sink.flush()
+    sink.close()
+    assert pq.read_table(path).num_rows == 5
+
+
+def test_unpriced_models_cost_nan(tmp_path):
+    with CompletionColumnarSink(tmp_path / "out.csv", format="csv") as sink:
+        sink.extend([response(0, SMALL), response(1, "unknown")])
+    costs = sink.cost_by_model()
+    assert math.isnan(costs["unknown"])
+    assert costs[SMALL] > 0
+    assert sink.unpriced_models == ["unknown"]
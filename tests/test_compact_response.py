@@ -0,0 +1,46 @@
+from lion_perplexity.api_endpoints.chat_completions.response.compact import (
+    CitationTable,
+    CompactChatCompletion,
+)
+from lion_perplexity.api_endpoints.chat_completions.response.response_body import (
+    PerplexityChatCompletionResponseBody,
+)
+
+RESPONSE = {
+    "id": "resp-1",
+    "model": "llama-3.1-sonar-small-128k-online",
+    "object": "chat.completion",
+    "created": 1700000000,
+    "choices": [
+        {
+            "index": 0,
+            "message": {"role": "assistant", "content": "answer"},
+            "finish_reason": "stop",
+            "delta": {"role": "assistant", "content": ""},
+        }
+    ],
+    "usage": {"prompt_tokens": 3, "completion_tokens": 5, "total_tokens": 8},
+    "citations": [
+        "https://a.example/1",
+        {"url": "https://b.example/2", "title": "B", "year": 2024},
+        {"url": "https://c.example/3", "score": 0.5},
+        "https://a.example/1",
+    ],
+    "related_questions": [{"text": "why?"}],
+}
+
+
+def test_round_trip_is_lossless():
+    body = PerplexityChatCompletionResponseBody(**RESPONSE)
+    table = CitationTable()
+
+    compact = CompactChatCompletion.from_model(body, table)
+    assert compact.to_model().model_dump() == body.model_dump()
+    assert compact.from_response(RESPONSE, table) == compact
+    assert len(table) == 3
+    assert compact.citation_urls == [
+        "https://a.example/1",
+        "https://b.example/2",
+        "https://c.example/3",
+        "https://a.example/1",
+    ]
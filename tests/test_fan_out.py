@@ -0,0 +1,65 @@
+import asyncio
+
+from lion_perplexity.api_endpoints.chat_completions.request.request_body import (
+    PerplexityChatCompletionRequestBody,
+)
+from lion_perplexity.api_endpoints.chat_completions.response.response_body import (
+    PerplexityChatCompletionResponseBody,
+)
+from lion_perplexity.fan_out import ChatCompletionFanOut
+
+MODEL = "llama-3.1-sonar-small-128k-online"
+
+
+class DelayedModel:
+    """Answers each sub-query after a delay picked by its recency filter."""
+
+    delays = {"hour": 0.01, "day": 0.02, "week": 0.03, "month": 5}
+
+    async def invoke(self, body):
+        await asyncio.sleep(self.delays[body.search_recency_filter])
+        if body.search_recency_filter == "day":
+            raise ConnectionError("dropped")
+        return PerplexityChatCompletionResponseBody(
+            id=body.search_recency_filter,
+            model=MODEL,
+            object="chat.completion",
+            created=0,
+            choices=[
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "answer"},
+                    "finish_reason": "stop",
+                }
+            ],
+            usage={
+                "prompt_tokens": 1,
+                "completion_tokens": 2,
+                "total_tokens": 3,
+            },
+            citations=["https://a.example/x", "http://www.a.example/x/"],
+            related_questions=[{"text": "Why  not?"}, {"text": "why not?"}],
+        )
+
+
+async def test_fan_out_stops_at_quorum_and_merges():
+    bodies = [
+        PerplexityChatCompletionRequestBody(
+            model=MODEL,
+            messages=[{"role": "user", "content": "q"}],
+            search_recency_filter=recency,
+        )
+        for recency in ("month", "week", "day", "hour")
+    ]
+    fan_out = ChatCompletionFanOut(DelayedModel(), bodies, quorum=2)
+
+    order = [result.index async for result in fan_out]
+    merged = await fan_out.merged()
+
+    assert order == [3, 2, 1]
+    assert [r.response.id for r in merged.answers] == ["hour", "week"]
+    assert isinstance(merged.errors[0].error, ConnectionError)
+    assert merged.cancelled == [0]
+    assert merged.citations == ["https://a.example/x"]
+    assert merged.related_questions == ["Why  not?"]
+    assert merged.usage.total_tokens == 6
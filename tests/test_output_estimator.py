@@ -0,0 +1,94 @@
+import random
+
+from lion_perplexity.api_endpoints.output_estimator import (
+    OutputLengthEstimator,
+)
+from lion_perplexity.PerplexityModel import PerplexityModel
+from tests.conftest import CompletionTransport, make_body, make_model
+
+
+def test_estimate_learns_quantile_per_prompt_length():
+    estimator = OutputLengthEstimator(quantile=0.9, min_samples=100)
+    rng = random.Random(0)
+    lengths = [rng.randint(100, 500) for _ in range(1000)]
+
+    assert estimator.estimate(50) is None
+    for length in lengths:
+        estimator.observe(50, length, reserved=4096)
+
+    estimate = estimator.estimate(50)
+    p90 = sorted(lengths)[899]
+    assert p90 <= estimate <= p90 * 1.1 + 1
+    # unseen prompt lengths fall back to the model-wide histogram
+    assert estimator.estimate(3000) == estimate
+
+    # truncated completions are reconciled but not learned from
+    estimator.observe(3000, 10, reserved=5, truncated=True)
+    assert estimator.estimate(3000) == estimate
+    assert estimator.stats.under_reserved == 1
+    assert estimator.stats.observations == 1001
+
+
+def test_model_reservation_uses_estimator():
+    model = make_model(output_estimator=OutputLengthEstimator(min_samples=2))
+    assert model.resolve_estimated_output_len(input_tokens_len=10) == 4096
+
+    for _ in range(2):
+        model.output_estimator.hold(10, 4096)
+        model.output_estimator.reconcile(
+            10,
+            4096,
+            {
+                "choices": [{"finish_reason": "stop"}],
+                "usage": {"completion_tokens": 300},
+            },
+        )
+    reserved = model.resolve_estimated_output_len(input_tokens_len=10)
+    assert 300 <= reserved < 340
+    assert model.resolve_estimated_output_len(77, input_tokens_len=10) == 77
+    assert model.output_estimator.stats.over_reserved_tokens == 2 * 3796
+    assert model.output_estimator.in_flight_tokens == 0
+
+
+def test_held_reservations_block_admission_from_cold_start():
+    model = make_model(
+        limit_tokens=5000, output_estimator=OutputLengthEstimator()
+    )
+    assert model.rate_limiter.remaining_tokens is None
+    assert model.verify_invoke_viability(100, 400)
+
+    model.output_estimator.hold(100_000, 0)
+    assert not model.verify_invoke_viability(100, 400)
+
+    model.output_estimator.reconcile(100_000, 0)
+    assert model.verify_invoke_viability(100, 400)
+    assert not model.verify_invoke_viability(100, 4901)
+
+
+class HoldCheckingTransport(CompletionTransport):
+    """Records the estimator's held tokens while a request is out."""
+
+    model: PerplexityModel | None = None
+    held: list[int] = []
+
+    async def answer(self, prompt):
+        self.held.append(self.model.output_estimator.in_flight_tokens)
+        return "ok"
+
+
+async def test_invoke_holds_its_reservation_until_reconciled():
+    transport = HoldCheckingTransport(
+        usage={
+            "prompt_tokens": 2,
+            "completion_tokens": 300,
+            "total_tokens": 302,
+        }
+    )
+    model = make_model(transport, output_estimator=OutputLengthEstimator())
+    transport.model = model
+
+    await model.invoke(make_body("two words"), estimated_output_len=500)
+
+    assert transport.held == [2 + 500]
+    assert model.output_estimator.in_flight_tokens == 0
+    assert model.output_estimator.stats.used_tokens == 300
@@ -0,0 +1,99 @@
+import math
+from unittest import mock
+
+import pytest
+import tiktoken
+
+from lion_perplexity import preflight as preflight_module
+from lion_perplexity.preflight import _count_tokens, count_tokens, preflight
+
+MODEL = "llama-3.1-sonar-small-128k-online"
+
+
+def byte_encoding(encoding_name):
+    """One token per byte, so tests need no downloaded encoding."""
+    return tiktoken.Encoding(
+        name=encoding_name,
+        pat_str=r"\s+|\S+",
+        mergeable_ranks={bytes([i]): i for i in range(256)},
+        special_tokens={"<|endoftext|>": 256},
+    )
+
+
+def test_preflight_reports_errors_tokens_and_costs(monkeypatch):
+    monkeypatch.setattr(
+        preflight_module,
+        "_count_tokens",
+        lambda encoding_name, texts: [len(text.split()) for text in texts],
+    )
+    rows = [
+        {
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": "be brief"},
+                {"role": "user", "content": "what is new today"},
+            ],
+            "max_tokens": 100,
+        },
+        {"model": MODEL, "messages": [{"role": "robot", "content": "hi"}]},
+        {"model": MODEL, "messages": [{"role": "user", "content": "hi"}]},
+        {
+            "model": MODEL,
+            "messages": [{"role": "user", "content": "hi"}],
+            "search_recency_filter": "year",
+        },
+        {"model": "unknown", "messages": [{"role": "user", "content": "x"}]},
+    ]
+
+    report = preflight(rows, estimated_output_len=50, limit_tokens=1000)
+
+    assert sorted(report.errors) == [1, 3]
+    assert "messages.0.role" in report.errors[1]
+    assert list(report.input_tokens) == [6, 0, 1, 0, 1]
+    assert list(report.output_tokens) == [100, 0, 50, 0, 50]
+    assert report.costs[0] == 6 * 0.000001 + 100 * 0.000002
+    assert math.isnan(report.costs[4])
+    assert report.unpriced_rows == [4]
+    assert report.total_cost == report.costs[0] + report.costs[2]
+    assert len(report.valid_bodies) == 3
+    assert report.summary()["input_tokens"] == 8
+
+    report = preflight(rows[:1], limit_tokens=50)
+    assert 0 in report.errors and report.total_cost == 0
+
+
+def test_preflight_rejects_special_tokens_like_invoke(monkeypatch):
+    monkeypatch.setattr(tiktoken, "get_encoding", byte_encoding)
+    rows = [
+        {
+            "model": MODEL,
+            "messages": [
+                {"role": "system", "content": "abc"},
+                {"role": "user", "content": "a <|endoftext|>"},
+            ],
+        },
+        {"model": MODEL, "messages": [{"role": "user", "content": "abc"}]},
+    ]
+
+    report = preflight(rows, estimated_output_len=10)
+
+    assert list(report.errors) == [0]
+    assert "special tokens" in report.errors[0]
+    assert list(report.input_tokens) == [0, 3]
+    assert report.request_bodies[0] is None
+
+
+def count_in_worker(encoding_name, texts):
+    """``_count_tokens`` with ``byte_encoding``, importable by workers."""
+    with mock.patch.object(tiktoken, "get_encoding", byte_encoding):
+        return _count_tokens(encoding_name, texts)
+
+
+def test_count_tokens_in_a_process_pool(monkeypatch):
+    monkeypatch.setattr(preflight_module, "_count_tokens", count_in_worker)
+    texts = [f"text {i}" for i in range(50)] + ["<|endoftext|>"]
+
+    counts = count_tokens(texts, max_workers=2, parallel_threshold=10)
+
+    assert counts == [len(text) for text in texts[:-1]] + [-1]
+    assert counts == count_tokens(texts, parallel_threshold=len(texts) + 1)
@@ -0,0 +1,116 @@
+import json
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from lion_perplexity.api_endpoints.api_request import PerplexityRequest
+from lion_perplexity.api_endpoints.record_replay import (
+    RecordingTransport,
+    ReplayTransport,
+    TrafficArchive,
+)
+from lion_perplexity.api_endpoints.transport import AiohttpTransport
+from tests.conftest import CompletionTransport, chunk, completion
+
+RESPONSE = completion()
+CHUNKS = [chunk("ans"), chunk("wer")]
+
+
+def make_request(transport):
+    return PerplexityRequest(
+        api_key="key",
+        endpoint="chat/completions",
+        method="POST",
+        transport=transport,
+    )
+
+
+async def test_record_then_replay(tmp_path):
+    path = tmp_path / "traffic.lpx"
+    body = {"model": "m", "messages": [{"role": "user", "content": "q"}]}
+
+    stub = CompletionTransport()
+    with TrafficArchive(path, "w") as archive:
+        recorder = make_request(
+            RecordingTransport(transport=stub, archive=archive)
+        )
+        assert await recorder.invoke(json_data=body) == RESPONSE
+        recorded = [
+            c async for c in recorder.stream(json_data=dict(body), verbose=0)
+        ]
+    assert recorded == CHUNKS
+    assert stub.calls == 2
+
+    with TrafficArchive(path) as archive:
+        assert len(archive) == 2
+        replayer = make_request(ReplayTransport(archive=archive))
+        # key order must not matter
+        reordered = {"messages": body["messages"], "model": "m"}
+        assert await replayer.invoke(json_data=reordered) == RESPONSE
+        replayed = [
+            c async for c in replayer.stream(json_data=dict(body), verbose=0)
+        ]
+    assert replayed == CHUNKS
+
+
+async def test_append_is_replayable_and_partial_streams_are_dropped(tmp_path):
+    path = tmp_path / "traffic.lpx"
+    body = {"model": "m", "messages": [{"role": "user", "content": "q"}]}
+
+    with TrafficArchive(path, "a", cache_size=1) as archive:
+        recorder = make_request(
+            RecordingTransport(
+                transport=CompletionTransport(), archive=archive
+            )
+        )
+        await recorder.invoke(json_data=body)
+        assert len(archive) == 1
+
+        # abandon the stream after its first chunk
+        chunks = recorder.stream(json_data=dict(body), verbose=0)
+        await anext(chunks)
+        await chunks.aclose()
+        assert len(archive) == 1
+
+        # the same archive object replays what it just recorded
+        replayer = make_request(ReplayTransport(archive=archive))
+        assert await replayer.invoke(json_data=body) == RESPONSE
+
+    with TrafficArchive(path, "a") as archive:
+        recorder = make_request(
+            RecordingTransport(
+                transport=CompletionTransport(), archive=archive
+            )
+        )
+        await recorder.invoke(json_data={**body, "model": "other"})
+        assert len(archive) == 2
+        replayer = make_request(ReplayTransport(archive=archive))
+        assert await replayer.invoke(json_data=body) == RESPONSE
+
+
+async def test_aiohttp_transport_sends_json_and_streams_downloads(tmp_path):
+    seen = []
+
+    async def echo(request):
+        seen.append(request.headers.get("Content-Type"))
+        return web.json_response(await request.json())
+
+    app = web.Application()
+    app.router.add_post("/chat/completions", echo)
+    async with TestServer(app) as server:
+        request = PerplexityRequest(
+            api_key="key",
+            endpoint="chat/completions",
+            method="POST",
+            content_type=None,
+            base_url=str(server.make_url("")).rstrip("/"),
+            transport=AiohttpTransport(),
+        )
+        body = {"model": "m", "messages": []}
+        assert await request.invoke(json_data=body) == body
+
+        output = tmp_path / "response.json"
+        assert await request.invoke(json_data=body, output_file=output) is None
+
+    assert seen == ["application/json"] * 2
+    assert json.loads(output.read_bytes()) == body
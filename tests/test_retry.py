@@ -0,0 +1,141 @@
+import json
+from contextlib import asynccontextmanager
+
+import pytest
+from lion_service.rate_limiter import RateLimitError
+
+from lion_perplexity.api_endpoints.api_request import PerplexityAPIError
+from lion_perplexity.api_endpoints.retry import (
+    RetryEngine,
+    RetryPolicy,
+    StreamInterruptedError,
+)
+from lion_perplexity.api_endpoints.transport import TransportResponse
+from tests.conftest import (
+    DATE,
+    CompletionTransport,
+    chunk,
+    make_body,
+    make_model,
+)
+
+DELTAS = ["Hel", "lo ", "wor", "ld"]
+
+
+class FlakyStreamTransport(CompletionTransport):
+    """Streams DELTAS, dropping the connection after ``fail_after`` lines.
+
+    Each call takes the next of ``generations`` instead, if any are left.
+    """
+
+    fail_after: list[int | None]
+    generations: list[list[str]] = []
+
+    def _next_generation(self) -> list[str]:
+        return self.generations.pop(0) if self.generations else DELTAS
+
+    async def answer(self, prompt):
+        return "".join(self._next_generation())
+
+    @asynccontextmanager
+    async def stream(self, method, url, headers, data=None):
+        self.bodies.append(data)
+        fail_after = self.fail_after.pop(0)
+        deltas = self._next_generation()
+
+        async def lines():
+            for i, content in enumerate(deltas):
+                if i == fail_after:
+                    raise ConnectionResetError("connection dropped")
+                yield f"data: {json.dumps(chunk(content))}\n".encode()
+
+        yield TransportResponse(
+            status=200, headers={"date": DATE}, lines=lines()
+        )
+
+
+def make_retrying_model(transport, max_retries=3):
+    return make_model(
+        transport,
+        retry_engine=RetryEngine(
+            policy=RetryPolicy(max_retries=max_retries, base_delay=0)
+        ),
+    )
+
+
+async def test_stream_is_retried_before_any_content():
+    transport = FlakyStreamTransport(fail_after=[0, None])
+    chunks = await make_retrying_model(transport).stream(
+        make_body(stream=True), verbose=False
+    )
+
+    text = "".join(c["choices"][0]["delta"]["content"] for c in chunks)
+    assert text == "Hello world"
+    # the same serialized body is reused by the retry
+    assert transport.bodies[0] == transport.bodies[1]
+
+
+async def test_stream_is_not_spliced_with_a_new_generation():
+    transport = FlakyStreamTransport(
+        fail_after=[4, None],
+        generations=[
+            ["The ", "cat ", "sat ", "on ", "the mat."],
+            ["A dog ", "ran to ", "the park."],
+        ],
+    )
+    with pytest.raises(StreamInterruptedError) as exc_info:
+        await make_retrying_model(transport).stream(
+            make_body(stream=True), verbose=False
+        )
+
+    partial = exc_info.value.chunks
+    text = "".join(c["choices"][0]["delta"]["content"] for c in partial)
+    assert text == "The cat sat on "
+    assert len(transport.bodies) == 1
+
+
+async def test_stream_keeps_partial_chunks_when_retries_run_out():
+    transport = FlakyStreamTransport(fail_after=[2])
+    with pytest.raises(StreamInterruptedError) as exc_info:
+        await make_retrying_model(transport, max_retries=0).stream(
+            make_body(stream=True), verbose=False
+        )
+    assert len(exc_info.value.chunks) == 2
+
+
+async def test_client_errors_are_not_retried():
+    engine = RetryEngine(policy=RetryPolicy(base_delay=0))
+    calls = []
+
+    async def attempt():
+        calls.append(1)
+        raise PerplexityAPIError("bad request", status=400)
+
+    with pytest.raises(PerplexityAPIError):
+        await engine.run(attempt)
+    assert len(calls) == 1
+
+
+async def test_wait_for_capacity_returns_once_capacity_frees_up():
+    model = make_retrying_model(
+        FlakyStreamTransport(fail_after=[]), max_retries=0
+    )
+    model.capacity_poll_interval = 0.01
+    model.output_estimator.hold(100, 100)
+    viable = iter([False, False, True])
+    object.__setattr__(
+        model, "verify_invoke_viability", lambda **kwargs: next(viable)
+    )
+
+    await model.wait_for_capacity(10, 10)
+
+
+async def test_wait_for_capacity_gives_up_after_timeout():
+    model = make_retrying_model(FlakyStreamTransport(fail_after=[]))
+    model.capacity_poll_interval = 0.01
+    model.capacity_timeout = 0.05
+    model.output_estimator.hold(100, 100)
+    object.__setattr__(model, "verify_invoke_viability", lambda **kwargs: 0)
+
+    with pytest.raises(RateLimitError):
+        await model.wait_for_capacity(10, 10)
@@ -0,0 +1,120 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from lion_perplexity.api_endpoints.api_request import PerplexityAPIError
+from lion_perplexity.api_endpoints.coalescer import RequestCoalescer
+from lion_perplexity.api_endpoints.transport import (
+    AiohttpTransport,
+    TransportResponse,
+)
+from lion_perplexity.sync_client import SyncPerplexityClient
+from tests.conftest import CompletionTransport, make_body, make_model
+
+
+class EchoTransport(CompletionTransport):
+    """Answers with the prompt after the delay given as its last word.
+
+    A prompt of ``fail`` gets a 400.
+    """
+
+    async def answer(self, prompt):
+        if prompt == "fail":
+            return TransportResponse(
+                status=400, body=b'{"error": {"message": "bad request"}}'
+            )
+        await asyncio.sleep(float(prompt.split()[-1]))
+        return prompt
+
+
+def test_invoke_blocks_for_the_response():
+    transport = EchoTransport()
+    with SyncPerplexityClient(make_model(transport)) as client:
+        response = client.invoke(make_body("hello 0.01"))
+    assert response.choices[0].message.content == "hello 0.01"
+    assert transport.calls == 1
+
+
+def test_stream_yields_chunks_and_early_close_cancels():
+    transport = EchoTransport(deltas=[str(i) for i in range(100)], delay=0.01)
+    with SyncPerplexityClient(make_model(transport)) as client:
+        chunks = client.stream(make_body(stream=True))
+        first = next(chunks)
+        assert first["choices"][0]["delta"]["content"] == "0"
+        chunks.close()
+        assert transport.stream_closed.wait(1)
+
+        transport.deltas = ["0", "1", "2"]
+        contents = [
+            c["choices"][0]["delta"]["content"]
+            for c in client.stream(make_body(stream=True))
+        ]
+    assert contents == ["0", "1", "2"]
+
+
+def test_stream_chunk_timeout_raises_timeout_error():
+    transport = EchoTransport(delay=5)
+    with SyncPerplexityClient(make_model(transport), timeout=0.05) as client:
+        with pytest.raises(TimeoutError):
+            list(client.stream(make_body(stream=True)))
+        assert transport.stream_closed.wait(1)
+
+
+def test_map_keeps_input_order_with_exceptions():
+    bodies = [
+        make_body("slow 0.05"),
+        make_body("fail"),
+        make_body("fast 0"),
+    ]
+    with SyncPerplexityClient(make_model(EchoTransport())) as client:
+        results = client.map(bodies, return_exceptions=True)
+
+    assert results[0].choices[0].message.content == "slow 0.05"
+    assert isinstance(results[1], PerplexityAPIError)
+    assert results[2].choices[0].message.content == "fast 0"
+
+
+def test_concurrent_calls_from_threads():
+    transport = EchoTransport()
+    with SyncPerplexityClient(make_model(transport)) as client:
+
+        def work(thread):
+            return [
+                client.invoke(make_body(f"t{thread}-{i} 0.001"))
+                .choices[0]
+                .message.content
+                for i in range(5)
+            ]
+
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            results = list(pool.map(work, range(8)))
+
+    assert results == [
+        [f"t{thread}-{i} 0.001" for i in range(5)] for thread in range(8)
+    ]
+    assert transport.calls == 40
+
+
+def test_caller_model_and_transport_are_left_alone():
+    model = make_model()
+    default_transport = model.request_model.transport
+    model.coalescer = RequestCoalescer()
+    client = SyncPerplexityClient(model)
+    assert model.request_model.transport is default_transport
+    assert client.perplexity_model.request_model.transport.pooled
+    assert client.perplexity_model.rate_limiter is model.rate_limiter
+    # in-flight coalescer tasks are bound to the client's loop
+    assert client.perplexity_model.coalescer is not model.coalescer
+    client.close()
+
+    class TrackedTransport(EchoTransport):
+        closed: bool = False
+
+        async def close(self):
+            self.closed = True
+
+    transport = TrackedTransport()
+    SyncPerplexityClient(make_model(transport)).close()
+    assert not transport.closed
+    assert isinstance(default_transport, AiohttpTransport)